@@ -0,0 +1,111 @@
+import os, subprocess, threading
+import numpy as np
+from render import RenderError
+
+
+class SceneAnalyzer:
+    width = 64
+    height = 36
+    frameRate = 10
+    sampleRate = 8000
+    window = 400
+    bins = 16
+    chunkFrames = 256
+    sceneThreshold = 0.3
+    minScene = 1000
+    silenceLevel = -40
+    minSilence = 700
+    padding = 100
+
+    def __init__(self, file):
+        self.file = file
+        self.scores = np.zeros(0)
+        self.levels = np.zeros(0)
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def getCmd(self, audioFd=None):
+        cmd = ['ffmpeg', '-v', 'error', '-i', self.file,
+               '-map', '0:v:0', '-vf', f'fps={self.frameRate},scale={self.width}:{self.height}:flags=fast_bilinear,format=gray',
+               '-f', 'rawvideo', 'pipe:1']
+        if audioFd is not None:
+            cmd += ['-map', '0:a:0', '-ac', '1', '-ar', str(self.sampleRate), '-f', 's16le', f'pipe:{audioFd}']
+        return cmd
+
+    def run(self):
+        from probe import hasAudio
+        levels = []
+        reader = None
+        if hasAudio(self.file):
+            readFd, writeFd = os.pipe()
+            try:
+                process = subprocess.Popen(self.getCmd(writeFd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(writeFd,))
+            finally:
+                os.close(writeFd)
+            reader = threading.Thread(target=self.readAudio, args=(os.fdopen(readFd, 'rb'), levels), daemon=True)
+            reader.start()
+        else:
+            process = subprocess.Popen(self.getCmd(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        scores = self.readVideo(process.stdout)
+        if self.stopped:
+            process.kill()
+        error = process.stderr.read().decode(errors='replace')
+        if reader is not None:
+            reader.join()
+        if process.wait() != 0 and not self.stopped:
+            raise RenderError([('analysis', process.returncode, error)])
+        self.scores = np.concatenate(scores) if scores else np.zeros(0)
+        self.levels = np.concatenate(levels) if levels else np.zeros(0)
+
+    def readVideo(self, stream):
+        size = self.width * self.height
+        scores = []
+        previous = None
+        while not self.stopped:
+            data = stream.read(size * self.chunkFrames)
+            if len(data) < size:
+                break
+            frames = np.frombuffer(data[:len(data) // size * size], np.uint8).reshape(-1, size)
+            rows = np.arange(len(frames))[:, None] * self.bins
+            histograms = np.bincount(((frames >> 4) + rows).ravel(), minlength=len(frames) * self.bins).reshape(-1, self.bins) / size
+            if previous is None:
+                previous = frames[:1], histograms[:1]
+            difference = np.abs(frames.astype(np.int16) - np.concatenate((previous[0], frames[:-1]))).mean(axis=1) / 255
+            histogramDifference = np.abs(histograms - np.concatenate((previous[1], histograms[:-1]))).sum(axis=1) / 2
+            scores.append((difference + histogramDifference) / 2)
+            previous = frames[-1:], histograms[-1:]
+        return scores
+
+    def readAudio(self, stream, levels):
+        rest = np.empty(0, np.int16)
+        with stream:
+            while True:
+                data = stream.read(self.window * 2 * 256)
+                if not data:
+                    break
+                samples = np.concatenate((rest, np.frombuffer(data[:len(data) // 2 * 2], np.int16)))
+                full = len(samples) // self.window * self.window
+                windows = samples[:full].reshape(-1, self.window).astype(np.float32) / 32768
+                levels.append(10 * np.log10(np.maximum((windows ** 2).mean(axis=1), 1e-10)))
+                rest = samples[full:]
+
+    def getCuts(self):
+        cuts = []
+        for frame in np.flatnonzero(self.scores > self.sceneThreshold):
+            position = int(frame * 1000 / self.frameRate)
+            if position > 0 and (not cuts or position - cuts[-1] >= self.minScene):
+                cuts.append(position)
+        return cuts
+
+    def getSilences(self):
+        step = self.window * 1000 / self.sampleRate
+        silent = np.concatenate(([False], self.levels < self.silenceLevel, [False]))
+        edges = np.flatnonzero(silent[1:] != silent[:-1])
+        silences = []
+        for first, last in zip(edges[::2], edges[1::2]):
+            start, end = first * step, last * step
+            if end - start >= self.minSilence:
+                silences.append((int(start + self.padding), int(end - self.padding)))
+        return silences
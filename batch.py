@@ -0,0 +1,165 @@
+import argparse, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from render import Overlay, RenderEngine, RenderError, containers, exportTargets, positions, profiles
+from cache import SegmentCache
+
+modes = ('single', 'parallel', 'smart', 'export')
+
+
+class EditDecisionList:
+    def __init__(self, name, source, segments, speed=0, overlays=(), mode='single', output=None, profile='normal', container='mp4', targets=()):
+        self.name = name
+        self.source = source
+        self.segments = segments
+        self.speed = speed
+        self.overlays = list(overlays)
+        self.mode = mode
+        self.output = output or name
+        self.profile = profile
+        self.container = container
+        self.targets = list(targets)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            if path.endswith(('.yaml', '.yml')):
+                import yaml
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        name = os.path.splitext(os.path.basename(path))[0]
+        segments = []
+        for segment in data.get('segments', []):
+            if isinstance(segment, dict):
+                start, duration, source = segment['start'], segment['duration'], segment.get('source')
+            else:
+                start, duration, source = segment[0], segment[1], segment[2] if len(segment) > 2 else None
+            if source:
+                segments.append((start, duration, os.path.join(directory, source)))
+            else:
+                segments.append((start, duration))
+        if not segments:
+            raise ValueError(f'{path}: no segments to keep')
+
+        overlays = []
+        if data.get('image'):
+            overlays.append({'image': data['image'], 'position': data.get('position', 'Left-Top')})
+        overlays += data.get('overlays', [])
+        for i, overlay in enumerate(overlays):
+            position = overlay.get('position', 'Left-Top')
+            if position not in positions:
+                raise ValueError(f'{path}: unknown image position {position!r}')
+            overlays[i] = Overlay(os.path.join(directory, overlay['image']), position, overlay.get('start', 0), overlay.get('end', 0), overlay.get('height', 0))
+
+        targets = data.get('targets', [])
+        for target in targets:
+            if target not in exportTargets:
+                raise ValueError(f'{path}: unknown export target {target!r}')
+            if targets.count(target) > 1:
+                raise ValueError(f'{path}: duplicate export target {target!r}')
+        mode = data.get('mode', 'export' if targets else 'single')
+        if mode == 'export' and not targets:
+            targets = list(exportTargets)
+        if mode not in modes:
+            raise ValueError(f'{path}: unknown render mode {mode!r}')
+        profile = data.get('profile', 'normal')
+        if profile not in profiles:
+            raise ValueError(f'{path}: unknown render profile {profile!r}')
+        container = data.get('container', 'mp4')
+        if container not in containers:
+            raise ValueError(f'{path}: unknown output container {container!r}')
+        return cls(name, os.path.join(directory, data['source']), segments, data.get('speed', 0), overlays, mode, data.get('output'), profile, container, targets)
+
+
+def findJobs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.json', '.yaml', '.yml')):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def findExisting(engine, output, mode='single', targets=()):
+    paths = [engine.getOutputPath(path) for path in engine.getOutputs(output, mode, targets)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def formatError(error):
+    # a malformed EDL or a missing optional module surfaces as an arbitrary exception; name it
+    if isinstance(error, (OSError, RenderError)):
+        return str(error)
+    return f'{type(error).__name__}: {error}'
+
+
+def renderJob(path, outputDir, threads, cache, traceDir=None, overwrite=False):
+    started = time.monotonic()
+    try:
+        edl = EditDecisionList.load(path)
+        engine = RenderEngine(edl.segments, edl.speed, edl.overlays, 1, threads, cache, profile=edl.profile, container=edl.container)
+        existing = findExisting(engine, os.path.join(outputDir, edl.output), edl.mode, edl.targets)
+        if existing and not overwrite:
+            return {'job': path, 'status': 'skipped', 'seconds': time.monotonic() - started, 'error': f'{", ".join(existing)} already exists (use --overwrite)'}
+        try:
+            engine.render(edl.source, os.path.join(outputDir, edl.output), edl.mode, targets=edl.targets)
+        finally:
+            if traceDir is not None and engine.trace is not None:
+                engine.trace.save(os.path.join(traceDir, f'{edl.output}.trace.json'), chrome=True)
+    except Exception as e:
+        return {'job': path, 'status': 'failed', 'seconds': time.monotonic() - started, 'error': formatError(e)}
+    return {'job': path, 'status': 'ok', 'seconds': time.monotonic() - started, 'error': ''}
+
+
+def renderAll(files, outputDir, jobs=None, cache=None, traceDir=None, overwrite=False):
+    jobs = jobs or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    os.makedirs(outputDir, exist_ok=True)
+    if traceDir is not None:
+        os.makedirs(traceDir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(lambda path: renderJob(path, outputDir, threads, cache, traceDir, overwrite), files))
+
+
+def printReport(results, out=sys.stdout):
+    width = max([len(result['job']) for result in results] + [3])
+    for result in results:
+        print(f"{result['job']:<{width}}  {result['status']:<7}  {result['seconds']:8.1f}s", file=out)
+        if result['error']:
+            print('    ' + result['error'].replace('\n', '\n    '), file=out)
+    failed = sum(result['status'] == 'failed' for result in results)
+    skipped = sum(result['status'] == 'skipped' for result in results)
+    total = sum(result['seconds'] for result in results)
+    print(f'{len(results) - failed - skipped} ok, {skipped} skipped, {failed} failed, {total:.1f}s of render time', file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render edit decision lists without the editor window.')
+    parser.add_argument('paths', nargs='+', help='EDL files (.json, .yaml) or directories containing them')
+    parser.add_argument('-o', '--output', default='.', help='directory for rendered videos')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of jobs rendered at once (default: CPU count)')
+    parser.add_argument('--report', help='write the per-job summary as JSON to this file')
+    parser.add_argument('--overwrite', action='store_true', help='replace existing output files instead of skipping their jobs')
+    parser.add_argument('--no-cache', action='store_true', help='do not reuse or store rendered segments')
+    parser.add_argument('--trace', help='directory for per-job Chrome trace files (open in chrome://tracing or Perfetto)')
+    args = parser.parse_args(argv)
+
+    files = findJobs(args.paths)
+    cache = None if args.no_cache else SegmentCache()
+    results = renderAll(files, args.output, args.jobs, cache, args.trace, args.overwrite)
+    if cache is not None:
+        cache.evict()
+
+    printReport(results)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result['status'] != 'failed' for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import argparse, json, os, platform, shutil, statistics, subprocess, sys, tempfile, time
+from render import runFfmpeg, profiles
+
+sources = {
+    'quick': [(10, '320x240')],
+    'full': [(10, '320x240'), (60, '1280x720'), (120, '1920x1080')]
+}
+segmentCounts = (10, 1000, 10000)
+
+
+def makeSource(directory, seconds, size, rate=30):
+    path = os.path.join(directory, f'testsrc_{size}_{seconds}s.mp4')
+    if not os.path.exists(path):
+        runFfmpeg(['ffmpeg', '-y', '-f', 'lavfi', '-i', f'testsrc=size={size}:rate={rate}:duration={seconds}',
+                   '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+                   '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate * 2), '-pix_fmt', 'yuv420p',
+                   '-c:a', 'aac', '-shortest', path], 'source')
+    return path
+
+
+def getVersion(program):
+    try:
+        return subprocess.run([program, '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    except OSError:
+        return ''
+
+
+def getLogic(duration, count):
+    from timeline import TimelineLogic
+    logic = TimelineLogic(duration)
+    step = duration // count
+    for i in range(1, count):
+        logic.cut(i * step)
+    logic.undoStack.clear()
+    return logic
+
+
+def timeCall(function, repeat):
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return {'median': statistics.median(times), 'min': min(times), 'max': max(times), 'repeat': repeat}
+
+
+def benchTimeline(count, repeat):
+    from edit import MoveAction
+    duration = count * 1000
+    started = time.perf_counter()
+    logic = getLogic(duration, count)
+    results = {'build': time.perf_counter() - started}
+    middle = count // 2
+
+    results['cut'] = timeCall(lambda: (logic.cut(middle * 1000 + 500), logic.undoStack.undo()), repeat)
+    logic.cut(middle * 1000 + 500)
+    results['undo'] = timeCall(lambda: (logic.undoStack.undo(), logic.undoStack.redo()), repeat)
+    logic.undoStack.undo()
+
+    def delete():
+        logic.selected = {logic.model[middle]}
+        logic.delete()
+        logic.undoStack.undo()
+    results['delete'] = timeCall(delete, repeat)
+
+    logic.selected = {logic.model[middle]}
+    logic.delete()
+    segment = logic.model[middle]
+    low, high = logic.model.getBounds(middle)
+    results['drag'] = timeCall(lambda: (logic.push(MoveAction(middle, segment.x, low, logic)), logic.undoStack.undo()), repeat)
+    return results
+
+
+def benchRender(source, seconds, modes, profile, workers):
+    from edit import EditLogic
+    logic = EditLogic(int(seconds * 1000))
+    logic.cache = None
+    for i in range(1, 8):
+        logic.cut(int(seconds * 1000 * i / 8))
+    logic.selected = {logic.model[i] for i in (1, 4, 6)}
+    logic.delete()
+
+    results = {}
+    output = tempfile.mkdtemp(prefix='bench-')
+    try:
+        for mode in modes:
+            if mode == 'smart' and shutil.which('ffprobe') is None:
+                results[mode] = {'skipped': 'ffprobe is not available'}
+                continue
+            stages = []
+            def progress(stage, percent, fps, eta):
+                if not stages or stages[-1][0] != stage:
+                    stages.append((stage, time.perf_counter()))
+
+            started = time.perf_counter()
+            keyframes = logic.getKeyframes(source) if mode == 'smart' else None
+            engine = logic.getRenderEngine(workers, progress=progress, profile=profile)
+            engine.render(source, os.path.join(output, mode), mode, keyframes)
+            finished = time.perf_counter()
+
+            bounds = [started] + [moment for stage, moment in stages[1:]] + [finished]
+            results[mode] = {
+                'seconds': finished - started,
+                'stages': {stage: bounds[i + 1] - bounds[i] for i, (stage, moment) in enumerate(stages)},
+                'outputBytes': os.path.getsize(os.path.join(output, mode) + '.mp4')
+            }
+    finally:
+        shutil.rmtree(output)
+    return results
+
+
+def getTimes(results):
+    times = {}
+    for source, modes in results['render'].items():
+        for mode, result in modes.items():
+            if 'seconds' in result:
+                times[f'render {source} {mode}'] = result['seconds']
+    for count, operations in results['timeline'].items():
+        for name, value in operations.items():
+            if name != 'build':
+                times[f'timeline {count} {name}'] = value['median']
+    return times
+
+
+def compare(results, baseline, tolerance, out=sys.stdout):
+    before = getTimes(baseline)
+    slower = 0
+    for name, seconds in getTimes(results).items():
+        if name not in before or before[name] == 0:
+            continue
+        ratio = seconds / before[name]
+        if ratio > tolerance:
+            slower += 1
+        print(f"{name:<50} {before[name] * 1000:10.2f}ms -> {seconds * 1000:10.2f}ms  x{ratio:.2f}{'  SLOWER' if ratio > tolerance else ''}", file=out)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark rendering and timeline editing on synthetic sources.')
+    parser.add_argument('-o', '--output', default='bench.json', help='file for the JSON results')
+    parser.add_argument('--quick', action='store_true', help='one short source and fewer repeats')
+    parser.add_argument('--modes', default='single,parallel,smart', help='comma separated render modes')
+    parser.add_argument('--profile', default='normal', choices=list(profiles), help='render profile')
+    parser.add_argument('--workers', type=int, default=None, help='parallel render workers')
+    parser.add_argument('--segments', default=','.join(map(str, segmentCounts)), help='comma separated timeline sizes')
+    parser.add_argument('--sources', default=os.path.join(tempfile.gettempdir(), 'videoeditor-bench'), help='directory for generated sources')
+    parser.add_argument('--skip-render', action='store_true')
+    parser.add_argument('--skip-timeline', action='store_true')
+    parser.add_argument('--baseline', help='earlier JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    if not args.skip_timeline:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(), 'ffmpeg': getVersion('ffmpeg')},
+        'settings': {'quick': args.quick, 'modes': args.modes, 'profile': args.profile, 'workers': args.workers},
+        'render': {},
+        'timeline': {}
+    }
+
+    if not args.skip_render:
+        os.makedirs(args.sources, exist_ok=True)
+        for seconds, size in sources['quick' if args.quick else 'full']:
+            source = makeSource(args.sources, seconds, size)
+            name = os.path.basename(source)
+            results['render'][name] = benchRender(source, seconds, args.modes.split(','), args.profile, args.workers)
+            print(name, ', '.join(f"{mode} {result['seconds']:.2f}s" if 'seconds' in result else f'{mode} skipped' for mode, result in results['render'][name].items()))
+
+    if not args.skip_timeline:
+        repeat = 5 if args.quick else 20
+        for count in map(int, args.segments.split(',')):
+            results['timeline'][str(count)] = benchTimeline(count, repeat)
+            print(f'{count} segments', ', '.join(f"{name} {value['median'] * 1000:.2f}ms" for name, value in results['timeline'][str(count)].items() if name != 'build'))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
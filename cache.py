@@ -0,0 +1,70 @@
+import hashlib, os, shutil, tempfile
+
+cacheDir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'videoeditor')
+fileIds = {}
+
+
+def getFileId(file):
+    stat = os.stat(file)
+    identity = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+    if identity not in fileIds:
+        sha = hashlib.sha1(str(stat.st_size).encode())
+        with open(file, 'rb') as f:
+            sha.update(f.read(1 << 20))
+            if stat.st_size > 2 << 20:
+                f.seek(-(1 << 20), os.SEEK_END)
+                sha.update(f.read())
+        fileIds[identity] = sha.hexdigest()
+    return fileIds[identity]
+
+
+class SegmentCache:
+    def __init__(self, directory=os.path.join(cacheDir, 'segments'), maxBytes=4 << 30):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def getKey(self, fileId, params):
+        return hashlib.sha1(repr((fileId, params)).encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.directory, f'{key}.mp4')
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, segment):
+        path = os.path.join(self.directory, f'{key}.mp4')
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp('.part', key, self.directory)
+        os.close(fd)
+        try:
+            shutil.move(segment, temp)
+            os.replace(temp, path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        return path
+
+    def evict(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.mp4') and entry.is_file():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
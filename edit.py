@@ -0,0 +1,339 @@
+import array, math, os, threading
+from render import RenderEngine, getCmdPos
+from keyframes import KeyframeIndex
+from cache import SegmentCache
+from segments import Segment, SegmentModel, Snapshot
+
+
+def getFrame(time, fps):
+    return math.ceil((math.floor(time) + 1) * fps / 1000 - 1e-6) - 1
+
+
+def getFrameTime(frame, fps):
+    return math.floor(frame * 1000 / fps + 1e-6)
+
+
+class UndoCommand:
+    def __init__(self, text=''):
+        self.description = text
+        self.obsolete = False
+
+    def text(self):
+        return self.description
+
+    def id(self):
+        return -1
+
+    def mergeWith(self, other):
+        return False
+
+    def isObsolete(self):
+        return self.obsolete
+
+    def setObsolete(self, obsolete):
+        self.obsolete = obsolete
+
+    def undo(self):
+        pass
+
+    def redo(self):
+        pass
+
+
+class UndoStack:
+    def __init__(self):
+        self.commands = []
+        self.position = 0
+        self.limit = 0
+
+    def setUndoLimit(self, limit):
+        self.limit = limit
+
+    def count(self):
+        return len(self.commands)
+
+    def index(self):
+        return self.position
+
+    def command(self, index):
+        return self.commands[index]
+
+    def canUndo(self):
+        return self.position > 0
+
+    def canRedo(self):
+        return self.position < len(self.commands)
+
+    def clear(self):
+        self.commands = []
+        self.position = 0
+
+    def push(self, command):
+        del self.commands[self.position:]
+        command.redo()
+        top = self.commands[-1] if self.commands else None
+        if top is not None and command.id() != -1 and command.id() == top.id() and top.mergeWith(command):
+            if top.isObsolete():
+                self.commands.pop()
+        elif not command.isObsolete():
+            self.commands.append(command)
+        if self.limit and len(self.commands) > self.limit:
+            del self.commands[:len(self.commands) - self.limit]
+        self.position = len(self.commands)
+
+    def dropOldest(self, count):
+        del self.commands[:count]
+        self.position = max(0, self.position - count)
+
+    def undo(self):
+        if self.canUndo():
+            self.position -= 1
+            self.commands[self.position].undo()
+
+    def redo(self):
+        if self.canRedo():
+            self.commands[self.position].redo()
+            self.position += 1
+
+
+class EditLogic:
+    undoLimit = 10000
+    maxHistoryBytes = 16 << 20
+
+    def __init__(self, duration=0, undoLimit=None, maxHistoryBytes=None):
+        self.durationVideo = duration
+        self.speed = 0
+        self.overlays = []
+        self.keyframes = {}
+        self.keyframesLock = threading.Lock()
+        self.frameRates = {}
+        self.cache = SegmentCache()
+
+        self.model = SegmentModel(duration)
+        self.selected = set()
+        self.undoStack = self.createUndoStack()
+        self.undoStack.setUndoLimit(undoLimit or self.undoLimit)
+        self.maxHistoryBytes = maxHistoryBytes or self.maxHistoryBytes
+        self.historyBytes = 0
+
+    def createUndoStack(self):
+        return UndoStack()
+
+    def refresh(self):
+        pass
+
+    def setDuration(self, duration):
+        self.durationVideo = duration
+        self.model.duration = duration
+
+    def addClip(self, file, duration):
+        if duration > 0:
+            self.push(AddClipAction(file, duration, self))
+
+    def replace(self, index, count, segments):
+        removed = self.model.replace(index, count, segments)
+        self.selected.difference_update(removed)
+        self.refresh()
+        return removed
+
+    def removeAt(self, indexes):
+        removed = self.model.removeAt(indexes)
+        self.selected.difference_update(removed)
+        self.refresh()
+        return removed
+
+    def insertAt(self, indexes, segments):
+        self.model.insertAt(indexes, segments)
+        self.refresh()
+
+    def move(self, index, x):
+        self.model.move(index, x)
+        self.refresh()
+
+    def snapToFrame(self, position):
+        index = self.model.find(position)
+        if index < 0:
+            return position
+        segment = self.model[index]
+        fps = self.frameRates.get(segment.source)
+        if not fps:
+            return position
+        time = segment.start + position - segment.x
+        time = min(max(getFrameTime(getFrame(time, fps), fps), segment.start), segment.start + segment.duration - 1)
+        return segment.x + time - segment.start
+
+    def cut(self, position):
+        position = self.snapToFrame(position)
+        index = self.model.find(position)
+        if index < 0 or position == self.model[index].x:
+            return
+
+        command = CutAction(position, index, self)
+        self.push(command)
+
+    def delete(self):
+        indexes = sorted(self.model.indexOf(segment) for segment in self.selected)
+        if not indexes:
+            return
+
+        command = DeleteAction(indexes, self)
+        self.push(command)
+
+    def autoCut(self, cuts, silences):
+        segments = self.model.split(cuts, silences)
+        if [(s.start, s.duration, s.x) for s in segments] == [(s.start, s.duration, s.x) for s in self.model]:
+            return
+        self.push(AutoCutAction(segments, self))
+
+    def push(self, command):
+        self.undoStack.push(command)
+        self.historyBytes += getattr(command, 'size', 0)
+        if self.historyBytes > self.maxHistoryBytes:
+            self.compactHistory()
+
+    def compactHistory(self):
+        commands = [self.undoStack.command(i) for i in range(self.undoStack.count())]
+        sizes = [getattr(command, 'size', 0) for command in commands]
+        total = sum(sizes)
+        for i, command in enumerate(commands):
+            if total <= self.maxHistoryBytes // 2:
+                break
+            if hasattr(command, 'compress'):
+                command.compress()
+                total += command.size - sizes[i]
+                sizes[i] = command.size
+        count = 0
+        while total > self.maxHistoryBytes // 2 and count < len(commands) - 1:
+            total -= sizes[count]
+            count += 1
+        if count:
+            self.foldHistory(count)
+        self.historyBytes = total
+
+    def foldHistory(self, count):
+        self.undoStack.dropOldest(count)
+
+    def render(self, file, output, mode='single', workers=None, threads=None, profile='normal', container='mp4', targets=()):
+        keyframes = self.getKeyframes(file) if mode == 'smart' else None
+        self.getRenderEngine(workers, threads, profile=profile, container=container).render(file, output, mode, keyframes, targets)
+
+    def getRenderEngine(self, workers=None, threads=None, progress=None, profile='normal', container='mp4'):
+        blocks = self.model.getBlocks()
+        return RenderEngine(blocks, self.speed, self.overlays, workers, threads, self.cache, progress, profile, container)
+
+    def getKeyframes(self, file, sources=None):
+        if sources is None:
+            sources = {segment.source or file for segment in self.model}
+        with self.keyframesLock:
+            for source in sources:
+                if source not in self.keyframes:
+                    self.keyframes[source] = KeyframeIndex.build(source)
+            return {source: self.keyframes[source] for source in sources}
+
+    def getCmdPos(self, width, height):
+        return getCmdPos(width, height)
+
+
+class CutAction(UndoCommand):
+    def __init__(self, position, index, logic):
+        super().__init__('Cut')
+        self.position = position
+        self.index = index
+        self.logic = logic
+
+    def undo(self):
+        left, right = self.logic.model[self.index], self.logic.model[self.index + 1]
+        self.logic.replace(self.index, 2, [Segment(left.start, left.duration + right.duration, left.x, left.source)])
+
+    def redo(self):
+        segment = self.logic.model[self.index]
+        offset = self.position - segment.x
+        left = Segment(segment.start, offset, segment.x, segment.source)
+        right = Segment(segment.start + offset, segment.duration - offset, self.position, segment.source)
+        self.logic.replace(self.index, 1, [left, right])
+
+
+class DeleteAction(UndoCommand):
+    def __init__(self, indexes, logic):
+        super().__init__('Delete')
+        self.indexes = array.array('q', indexes)
+        self.logic = logic
+        self.snapshot = None
+        self.size = 0
+
+    def compress(self):
+        if self.snapshot is not None:
+            self.snapshot.compress()
+            self.size = len(self.snapshot) + self.indexes.itemsize * len(self.indexes)
+
+    def undo(self):
+        self.logic.insertAt(self.indexes, self.snapshot.restore())
+
+    def redo(self):
+        compressed = self.snapshot is not None and self.snapshot.compressed
+        self.snapshot = Snapshot(self.logic.removeAt(self.indexes))
+        if compressed:
+            self.snapshot.compress()
+        self.size = len(self.snapshot) + self.indexes.itemsize * len(self.indexes)
+
+
+class AutoCutAction(UndoCommand):
+    def __init__(self, segments, logic):
+        super().__init__(f'Auto cut ({len(segments)} blocks)')
+        self.logic = logic
+        self.before = Snapshot(logic.model.segments)
+        self.after = Snapshot(segments)
+        self.size = len(self.before) + len(self.after)
+
+    def compress(self):
+        self.before.compress()
+        self.after.compress()
+        self.size = len(self.before) + len(self.after)
+
+    def undo(self):
+        self.logic.replace(0, len(self.logic.model), self.before.restore())
+
+    def redo(self):
+        self.logic.replace(0, len(self.logic.model), self.after.restore())
+
+
+class AddClipAction(UndoCommand):
+    def __init__(self, file, duration, logic):
+        super().__init__(f'Add clip {os.path.basename(file)}')
+        self.file = file
+        self.duration = duration
+        self.logic = logic
+
+    def undo(self):
+        self.logic.replace(len(self.logic.model) - 1, 1, [])
+        self.logic.setDuration(self.logic.durationVideo - self.duration)
+
+    def redo(self):
+        x = self.logic.durationVideo
+        self.logic.setDuration(x + self.duration)
+        self.logic.replace(len(self.logic.model), 0, [Segment(0, self.duration, x, self.file)])
+
+
+class MoveAction(UndoCommand):
+    def __init__(self, index, before, after, logic):
+        super().__init__('Move')
+        self.index = index
+        self.before = before
+        self.after = after
+        self.logic = logic
+
+    def id(self):
+        return 1
+
+    def mergeWith(self, other):
+        if other.index != self.index:
+            return False
+        self.after = other.after
+        self.setObsolete(self.after == self.before)
+        return True
+
+    def undo(self):
+        self.logic.move(self.index, self.before)
+
+    def redo(self):
+        self.logic.move(self.index, self.after)
@@ -0,0 +1,333 @@
+import argparse, os, socket, subprocess, sys, threading, time
+from collections import deque, namedtuple
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from render import ProcessGroup, RenderCancelled, RenderError, runFfmpeg
+from tracing import RenderTrace
+
+Usage = namedtuple('Usage', 'ru_utime ru_stime')
+keyVariable = 'VIDEOEDITOR_FARM_KEY'
+
+
+def parseAddress(text):
+    host, _, port = text.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def formatAddress(address):
+    if isinstance(address, tuple):
+        host = '127.0.0.1' if address[0] in ('', '0.0.0.0') else address[0]
+        return f'{host}:{address[1]}'
+    return address
+
+
+class RenderFarm:
+    chunkLength = 10000
+    retries = 2
+    timeout = 30
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, workers=0, chunkLength=None, retries=None, workDir=None):
+        self.address = address
+        self.authkey = authkey or os.urandom(16)
+        self.workers = workers
+        self.chunkLength = chunkLength or self.chunkLength
+        self.retries = self.retries if retries is None else retries
+        self.workDir = workDir
+        self.condition = threading.Condition()
+        self.closing = False
+
+    def render(self, engine, file, output, keyframes=None):
+        engine.farm = self
+        engine.render(file, output, 'farm', keyframes)
+
+    def startWorker(self, address):
+        env = dict(os.environ, **{keyVariable: self.authkey.hex()})
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), 'work', formatAddress(address), '--once'], stdin=subprocess.DEVNULL, env=env)
+
+    def runChunks(self, chunks, processes, trace):
+        self.chunks = chunks
+        self.queue = deque(range(len(chunks)))
+        self.attempts = [0] * len(chunks)
+        self.done = [False] * len(chunks)
+        self.errors = []
+        self.busy = {}
+        self.connected = 0
+        self.closing = False
+        self.trace = trace
+        if not chunks:
+            return
+
+        listener = Listener(self.address, authkey=self.authkey)
+        threads = []
+        accepting = threading.Thread(target=self.accept, args=(listener, threads), daemon=True)
+        accepting.start()
+        local = [self.startWorker(listener.address) for i in range(self.workers)]
+        try:
+            self.wait(processes, local, listener.address)
+        finally:
+            with self.condition:
+                self.closing = True
+                for conn in self.busy:
+                    self.send(conn, ('cancel',))
+                self.condition.notify_all()
+            try:
+                Client(listener.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+            accepting.join()
+            listener.close()
+            for thread in threads:
+                thread.join()
+            for process in local:
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def wait(self, processes, local, address):
+        idle = time.monotonic()
+        with self.condition:
+            while not self.isFinished():
+                self.condition.wait(0.2)
+                if processes.killed:
+                    raise RenderCancelled()
+                if self.connected:
+                    idle = time.monotonic()
+                elif time.monotonic() - idle > self.timeout or local and all(process.poll() is not None for process in local):
+                    raise RenderError([('farm', -1, f'no render workers connected to {formatAddress(address)}')])
+            if self.errors:
+                raise RenderError(self.errors)
+
+    def isFinished(self):
+        return bool(self.errors) or all(self.done)
+
+    def accept(self, listener, threads):
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                return
+            if self.closing:
+                conn.close()
+                return
+            thread = threading.Thread(target=self.serve, args=(conn,), daemon=True)
+            threads.append(thread)
+            thread.start()
+
+    def send(self, conn, message):
+        try:
+            conn.send(message)
+        except OSError:
+            pass
+
+    def serve(self, conn):
+        index = None
+        worker = '?'
+        try:
+            worker = conn.recv()[1]
+            with self.condition:
+                self.connected += 1
+            try:
+                while True:
+                    with self.condition:
+                        while not self.queue and not self.isFinished() and not self.closing:
+                            self.condition.wait()
+                        if self.closing or self.errors or not self.queue:
+                            conn.send(('stop',))
+                            return
+                        index = self.queue.popleft()
+                        self.busy[conn] = index
+                        conn.send(('chunk', index) + self.chunks[index][:2])
+                    self.runChunk(conn, worker, index)
+                    index = None
+            finally:
+                with self.condition:
+                    self.connected -= 1
+                    self.busy.pop(conn, None)
+                    self.condition.notify_all()
+        except (EOFError, OSError):
+            if index is not None:
+                with self.condition:
+                    self.retry(index, [(self.chunks[index][0], -1, f'worker {worker} disconnected')])
+                    self.condition.notify_all()
+        finally:
+            conn.close()
+
+    def runChunk(self, conn, worker, index):
+        name, cmd, reporter, segment = self.chunks[index]
+        started = time.perf_counter()
+        message = conn.recv()
+        while message[0] == 'progress':
+            if reporter is not None:
+                reporter(message[2])
+            message = conn.recv()
+        kind, index, returncode, errors, usage, io = message
+        self.trace.add(f'{name} on {worker}', cmd, started, time.perf_counter(), Usage(*usage), io, returncode)
+        with self.condition:
+            self.busy.pop(conn, None)
+            if returncode == 0:
+                self.done[index] = True
+            else:
+                self.retry(index, errors)
+            self.condition.notify_all()
+
+    def retry(self, index, errors):
+        try:
+            os.remove(self.chunks[index][3])
+        except FileNotFoundError:
+            pass
+        self.attempts[index] += 1
+        if self.closing:
+            return
+        if self.attempts[index] > self.retries:
+            self.errors += errors
+        else:
+            self.queue.append(index)
+
+
+class FarmWorker:
+    reconnect = 2
+
+    def __init__(self, address, authkey, name=None):
+        self.address = address
+        self.authkey = authkey
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+
+    def run(self, once=False):
+        while True:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except (OSError, AuthenticationError):
+                if once:
+                    raise
+                time.sleep(self.reconnect)
+                continue
+            with conn:
+                self.serve(conn)
+            if once:
+                return
+
+    def serve(self, conn):
+        try:
+            conn.send(('hello', self.name))
+            while True:
+                message = conn.recv()
+                if message[0] == 'stop':
+                    return
+                if message[0] == 'chunk':
+                    conn.send(self.runChunk(conn, *message[1:]))
+        except (EOFError, OSError):
+            return
+
+    def runChunk(self, conn, index, name, cmd):
+        processes = ProcessGroup()
+        trace = RenderTrace()
+        errors = []
+
+        def execute():
+            try:
+                runFfmpeg(cmd, name, lambda values: conn.send(('progress', index, values)), processes, trace)
+            except RenderError as e:
+                errors.extend(e.errors)
+
+        thread = threading.Thread(target=execute)
+        thread.start()
+        try:
+            while thread.is_alive():
+                if conn.poll(0.2):
+                    conn.recv()
+                    processes.kill()
+        finally:
+            if thread.is_alive():
+                processes.kill()
+            thread.join()
+
+        invocation = trace.invocations[-1] if trace.invocations else {}
+        returncode = invocation.get('returncode', -1) if not errors else errors[0][1] or -1
+        usage = (invocation.get('user', 0), invocation.get('system', 0))
+        io = (invocation.get('readBytes', 0), invocation.get('writeBytes', 0))
+        return ('done', index, returncode, errors, usage, io)
+
+
+def getKeyframes(sources):
+    from keyframes import KeyframeIndex
+    keyframes = {}
+    for source in sources:
+        try:
+            keyframes[source] = KeyframeIndex.build(source)
+        except (OSError, RenderError):
+            keyframes[source] = None
+    return keyframes
+
+
+def getAuthkey(text):
+    text = text or os.environ.get(keyVariable)
+    return bytes.fromhex(text) if text else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render long timelines in keyframe-aligned chunks on several worker processes or hosts.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render = commands.add_parser('render', help='split edit decision lists into chunks and hand them to workers')
+    render.add_argument('paths', nargs='+', help='EDL files (.json, .yaml) or directories containing them')
+    render.add_argument('-o', '--output', default='.', help='directory for rendered videos')
+    render.add_argument('--listen', default='127.0.0.1:0', help='HOST:PORT or socket path the workers connect to')
+    render.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='worker processes started on this machine')
+    render.add_argument('--chunk', type=float, default=RenderFarm.chunkLength / 1000, help='chunk length in seconds')
+    render.add_argument('--retries', type=int, default=RenderFarm.retries, help='attempts per chunk after the first one')
+    render.add_argument('--work-dir', help='directory for chunks, shared with remote workers')
+    render.add_argument('--authkey', help=f'hex key shared with the workers (default: ${keyVariable} or a random one)')
+    render.add_argument('--overwrite', action='store_true', help='replace existing output files instead of skipping their jobs')
+
+    work = commands.add_parser('work', help='render chunks for a coordinator')
+    work.add_argument('address', help='HOST:PORT or socket path of the coordinator')
+    work.add_argument('--authkey', help=f'hex key shared with the coordinator (default: ${keyVariable})')
+    work.add_argument('--once', action='store_true', help='exit after the coordinator finishes instead of waiting for the next render')
+    args = parser.parse_args(argv)
+
+    if args.command == 'work':
+        authkey = getAuthkey(args.authkey)
+        if authkey is None:
+            parser.error(f'work needs --authkey or ${keyVariable}')
+        try:
+            FarmWorker(parseAddress(args.address), authkey).run(args.once)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    from batch import EditDecisionList, findExisting, findJobs, formatError, printReport
+    from render import RenderEngine
+
+    farm = RenderFarm(parseAddress(args.listen), getAuthkey(args.authkey), args.workers, int(args.chunk * 1000), args.retries, args.work_dir)
+    if args.authkey is None and keyVariable not in os.environ and args.workers == 0:
+        print(f'{keyVariable}={farm.authkey.hex()}', file=sys.stderr)
+    os.makedirs(args.output, exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    results = []
+    for path in findJobs(args.paths):
+        started = time.monotonic()
+        try:
+            edl = EditDecisionList.load(path)
+            engine = RenderEngine(edl.segments, edl.speed, edl.overlays, threads=threads, profile=edl.profile, container=edl.container)
+            existing = findExisting(engine, os.path.join(args.output, edl.output))
+            if existing and not args.overwrite:
+                results.append({'job': path, 'status': 'skipped', 'seconds': time.monotonic() - started, 'error': f'{", ".join(existing)} already exists (use --overwrite)'})
+                continue
+            sources = {edl.source} | {segment[2] for segment in edl.segments if len(segment) > 2}
+            farm.render(engine, edl.source, os.path.join(args.output, edl.output), getKeyframes(sources))
+        except Exception as e:
+            results.append({'job': path, 'status': 'failed', 'seconds': time.monotonic() - started, 'error': formatError(e)})
+        else:
+            results.append({'job': path, 'status': 'ok', 'seconds': time.monotonic() - started, 'error': ''})
+    printReport(results)
+    return 0 if all(result['status'] != 'failed' for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
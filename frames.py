@@ -0,0 +1,98 @@
+import subprocess, threading
+import numpy as np
+from edit import getFrame, getFrameTime
+
+
+class FrameCache:
+    height = 360
+    maxBytes = 128 << 20
+    behind = 1 / 3
+    seekMargin = 0.25
+
+    def __init__(self, file, info, maxBytes=None):
+        self.file = file
+        self.rate = info.fps
+        self.fps = info.getFps()
+        self.frameHeight = min(self.height, info.height) // 2 * 2
+        self.frameWidth = max(2, round(info.width * self.frameHeight / info.height / 2) * 2)
+        self.frameBytes = self.frameWidth * self.frameHeight * 3
+        self.capacity = max(1, (maxBytes or self.maxBytes) // self.frameBytes)
+        self.buffer = np.zeros((self.capacity, self.frameHeight, self.frameWidth, 3), np.uint8)
+        self.indexes = np.full(self.capacity, -1, np.int64)
+        self.lastFrame = getFrame(info.duration, self.fps) if info.duration else None
+        self.center = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def getWindow(self):
+        start = max(0, self.center - int(self.capacity * self.behind))
+        end = start + self.capacity
+        if self.lastFrame is not None:
+            end = min(end, self.lastFrame + 1)
+        return start, end
+
+    def setPosition(self, position):
+        frame = getFrame(position, self.fps)
+        if frame != self.center:
+            self.center = frame
+            self.changed.set()
+
+    def get(self, frame):
+        with self.lock:
+            slot = frame % self.capacity
+            if self.indexes[slot] != frame:
+                return None
+            return self.buffer[slot].copy()
+
+    def stop(self):
+        self.stopped = True
+        self.changed.set()
+
+    def run(self):
+        self.changed.set()
+        while True:
+            self.changed.wait()
+            if self.stopped:
+                return
+            self.changed.clear()
+            start, end = self.getWindow()
+            for first, last in ((self.center, end), (start, self.center)):
+                frames = np.arange(first, last)
+                missing = frames[self.indexes[frames % self.capacity] != frames]
+                if len(missing) and not self.decode(missing[0], missing[-1] + 1):
+                    break
+
+    def decode(self, first, last):
+        start = max(0, getFrameTime(first, self.fps) / 1000 - self.seekMargin / self.fps)
+        cmd = ['ffmpeg', '-v', 'error', '-ss', str(start), '-i', self.file,
+               '-map', '0:v:0', '-frames:v', str(last - first),
+               '-vf', f'fps={self.rate},scale={self.frameWidth}:{self.frameHeight}', '-pix_fmt', 'rgb24', '-f', 'rawvideo', 'pipe:1']
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            return False
+        try:
+            for frame in range(first, last):
+                if self.stopped:
+                    return False
+                if self.changed.is_set():
+                    start, end = self.getWindow()
+                    if not start <= frame < end:
+                        return False
+                data = process.stdout.read(self.frameBytes)
+                if len(data) < self.frameBytes:
+                    if frame > first:
+                        self.lastFrame = frame - 1
+                    break
+                with self.lock:
+                    slot = frame % self.capacity
+                    self.buffer[slot] = np.frombuffer(data, np.uint8).reshape(self.frameHeight, self.frameWidth, 3)
+                    self.indexes[slot] = frame
+            return True
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
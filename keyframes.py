@@ -0,0 +1,62 @@
+import bisect, json
+from render import runFfmpeg
+
+copyCodecs = ('h264',)
+copyAudioCodecs = ('aac',)
+
+
+class KeyframeIndex:
+    def __init__(self, file, times, codec='h264', pixFmt='yuv420p', timescale='90000', audioCodec='aac', sampleRate=48000, decodeTimes=None):
+        self.file = file
+        self.times = times
+        self.decodeTimes = decodeTimes if decodeTimes is not None else times
+        self.codec = codec
+        self.pixFmt = pixFmt
+        self.timescale = timescale
+        self.audioCodec = audioCodec
+        self.sampleRate = sampleRate
+
+    @classmethod
+    def build(cls, file):
+        probe = runFfmpeg(['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name,pix_fmt,time_base,sample_rate', '-of', 'json', file], 'ffprobe')
+        streams = json.loads(probe)['streams']
+        stream = next(stream for stream in streams if stream['codec_type'] == 'video')
+        audio = next((stream for stream in streams if stream['codec_type'] == 'audio'), {})
+        timescale = stream['time_base'].split('/')[1]
+
+        packets = runFfmpeg(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,dts_time,flags', '-of', 'csv=p=0', file], 'ffprobe')
+        keyframes = []
+        for line in packets.splitlines():
+            pts, dts, flags = line.split(',')[:3]
+            if 'K' in flags and pts != 'N/A':
+                keyframes.append((float(pts) * 1000, float(dts if dts != 'N/A' else pts) * 1000))
+        keyframes.sort()
+        times = [pts for pts, dts in keyframes]
+        decodeTimes = [dts for pts, dts in keyframes]
+        return cls(file, times, stream['codec_name'], stream['pix_fmt'], timescale, audio.get('codec_name', ''), int(audio.get('sample_rate', 0)), decodeTimes)
+
+    def canCopy(self):
+        return self.codec in copyCodecs and self.audioCodec in copyAudioCodecs and self.sampleRate > 0 and len(self.times) > 0
+
+    def getEncodeArgs(self):
+        return ['-pix_fmt', self.pixFmt, '-video_track_timescale', self.timescale, '-ar', str(self.sampleRate)]
+
+    def getDecodeTime(self, time):
+        # packets are cut by dts when copied, so a part that ends on a keyframe has to stop at
+        # the keyframe's dts or the reordered frames after it leak into the copy
+        index = bisect.bisect_left(self.times, time)
+        if index == len(self.times) or self.times[index] != time:
+            return time
+        return self.decodeTimes[index]
+
+    def after(self, position):
+        index = bisect.bisect_left(self.times, position)
+        if index == len(self.times):
+            return None
+        return self.times[index]
+
+    def before(self, position):
+        index = bisect.bisect_right(self.times, position)
+        if index == 0:
+            return None
+        return self.times[index - 1]
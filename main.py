@@ -1,13 +1,67 @@
-import sys, os, time
+import sys, os, time, queue
 from PyQt5.QtGui import QIcon, QFont
-from PyQt5.QtCore import Qt, QObject, pyqtSignal, QDir, QUrl
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, QDir
 from PyQt5.QtWidgets import*
-from PyQt5.QtMultimedia import QMediaContent
 from workspace import WorkSpace
+from render import RenderError, RenderCancelled, Overlay, containers, exportTargets, profiles
 
 class Communicate(QObject):
     closeApp = pyqtSignal()
 
+class RenderThread(QThread):
+    progress = pyqtSignal(str, float, float, float)
+    rendered = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    queueChanged = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.jobs = queue.Queue()
+        self.engine = None
+
+    def addJob(self, logic, file, output, mode='single', profile='normal', container='mp4', targets=()):
+        engine = logic.getRenderEngine(progress=self.reportProgress, profile=profile, container=container)
+        self.jobs.put((engine, logic, file, output, mode, targets))
+        self.queueChanged.emit(self.jobs.qsize())
+
+    def reportProgress(self, stage, percent, fps, eta):
+        self.progress.emit(stage, percent, fps, -1 if eta is None else eta)
+
+    def cancel(self):
+        engine = self.engine
+        if engine is not None:
+            engine.cancel()
+
+    def stop(self):
+        self.cancel()
+        self.jobs.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            self.engine, logic, file, output, mode, targets = job
+            self.queueChanged.emit(self.jobs.qsize())
+            path = output if mode == 'export' else self.engine.getOutputPath(output)
+            keyframes = None
+            if mode == 'smart':
+                try:
+                    keyframes = logic.getKeyframes(file, self.engine.getInputs(file))
+                except (OSError, RenderError):
+                    pass
+            try:
+                self.engine.render(file, output, mode, keyframes, targets)
+            except RenderCancelled:
+                self.failed.emit(path, '')
+            except Exception as e:
+                self.failed.emit(path, str(e))
+            else:
+                self.rendered.emit(path, self.engine.trace)
+            self.engine = None
+
+
 class Window(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -24,17 +78,20 @@ class Window(QMainWindow):
         self.center()
 
         self.workspace = WorkSpace()
+        self.workspace.analyzed.connect(lambda text: self.statusBar().showMessage(text, 5000))
 
         self.widget = self.workspace.widget
         self.setCentralWidget(self.widget)
         self.speedIndexBox = 2
 
         self.createActions()
+        self.createRenderStatus()
         self.showMaximized()
 
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Message', 'Are you sure to quit?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
+            self.renderThread.stop()
             event.accept()
         else:
             event.ignore()
@@ -54,6 +111,10 @@ class Window(QMainWindow):
         openAction.setShortcut('Ctrl+O')
         openAction.triggered.connect(self.showOpenDialog)
 
+        addClipAction = QAction(QIcon(os.path.join('icons', 'open.png')), 'Add clip', self)
+        addClipAction.setShortcut('Ctrl+Shift+O')
+        addClipAction.triggered.connect(self.showAddClipDialog)
+
         exitAction = QAction(QIcon(os.path.join('icons', 'exit.png')), 'Exit', self)
         exitAction.setShortcut('Ctrl+Q')
         exitAction.triggered.connect(qApp.quit)
@@ -78,6 +139,23 @@ class Window(QMainWindow):
         imageAction.setShortcut('I')
         imageAction.triggered.connect(self.addImage)
 
+        autoCutAction = QAction(QIcon(os.path.join('icons', 'scissors.png')), 'Auto cut scenes and silence', self)
+        autoCutAction.setShortcut('Ctrl+Shift+C')
+        autoCutAction.triggered.connect(self.autoCut)
+
+        previewAction = QAction(QIcon(os.path.join('icons', 'video.png')), 'Preview edits', self)
+        previewAction.setShortcut('P')
+        previewAction.setCheckable(True)
+        previewAction.toggled.connect(self.workspace.setPreview)
+
+        nextFrameAction = QAction('Next frame', self)
+        nextFrameAction.setShortcut('.')
+        nextFrameAction.triggered.connect(lambda: self.workspace.stepFrame(1))
+
+        previousFrameAction = QAction('Previous frame', self)
+        previousFrameAction.setShortcut(',')
+        previousFrameAction.triggered.connect(lambda: self.workspace.stepFrame(-1))
+
         undoAction = QAction(QIcon(os.path.join('icons', 'undo.png')), 'Undo', self)
         undoAction.setShortcut('Ctrl+Z')
         undoAction.triggered.connect(self.undo)
@@ -89,6 +167,7 @@ class Window(QMainWindow):
         menu = self.menuBar()
         file = menu.addMenu('File')
         file.addAction(openAction)
+        file.addAction(addClipAction)
         file.addAction(renderAction)
         file.addAction(exitAction)
         edit = menu.addMenu('Edit')
@@ -99,6 +178,11 @@ class Window(QMainWindow):
         edit.addAction(delAction)
         edit.addAction(speedAction)
         edit.addAction(imageAction)
+        edit.addAction(autoCutAction)
+        edit.addSeparator()
+        edit.addAction(previewAction)
+        edit.addAction(nextFrameAction)
+        edit.addAction(previousFrameAction)
 
         toolBar = self.addToolBar('Cut')
         toolBar.addAction(undoAction)
@@ -108,21 +192,54 @@ class Window(QMainWindow):
         toolBar.addAction(delAction)
         toolBar.addAction(speedAction)
         toolBar.addAction(imageAction)
+        toolBar.addSeparator()
+        toolBar.addAction(previewAction)
+
+    def createRenderStatus(self):
+        self.renderProgress = QProgressBar()
+        self.renderProgress.setMaximumWidth(200)
+        self.renderText = QLabel()
+        self.cancelButton = QPushButton('Cancel')
+        self.cancelButton.clicked.connect(self.cancelRender)
+        self.statusBar().addPermanentWidget(self.renderText)
+        self.statusBar().addPermanentWidget(self.renderProgress)
+        self.statusBar().addPermanentWidget(self.cancelButton)
+        self.showRenderStatus(False)
+
+        self.renderThread = RenderThread()
+        self.renderThread.progress.connect(self.renderProgressChanged)
+        self.renderThread.rendered.connect(self.renderFinished)
+        self.renderThread.failed.connect(self.renderFailed)
+        self.renderThread.queueChanged.connect(self.renderQueueChanged)
+        self.renderThread.start()
+        self.queued = 0
+
+    def showRenderStatus(self, visible):
+        self.renderProgress.setVisible(visible)
+        self.renderText.setVisible(visible)
+        self.cancelButton.setVisible(visible)
 
     def showOpenDialog(self):
         fName, filter = QFileDialog.getOpenFileName(self, 'Open file', QDir.current().path())
         if fName != '':
             self.file = fName
-            self.workspace.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(fName)))
-            self.workspace.playButton.setEnabled(True)
-            self.workspace.mediaPlayer.play()
+            self.workspace.openSource(fName)
+
+    def showAddClipDialog(self):
+        fName, filter = QFileDialog.getOpenFileName(self, 'Add clip', QDir.current().path())
+        if fName != '':
+            self.workspace.addClip(fName)
 
     def cut(self):
-        self.workspace.timelineLogic.cut(self.workspace.positionVideo)
+        self.workspace.timelineLogic.cut(self.workspace.getPosition())
 
     def delete(self):
         self.workspace.timelineLogic.delete()
 
+    def autoCut(self):
+        if self.workspace.autoCut():
+            self.statusBar().showMessage('Analyzing scenes and silence...')
+
     def changeSpeed(self):
         values = [0.5, 0.75, 0, 1.25, 1.5, 1.75, 2]
         self.s = SpeedDialog(values.index(self.workspace.timelineLogic.speed))
@@ -150,22 +267,79 @@ class Window(QMainWindow):
             self.i.show()
 
     def putImagePos(self):
-        before = self.workspace.timelineLogic.imageToAdd
+        before = self.workspace.timelineLogic.overlays
         self.i.close()
         id = self.i.group.checkedId()
         btn = self.i.group.button(id)
         posText = btn.text()
-        command = ImageAction(before, (self.image, posText), self.workspace.timelineLogic)
+        overlay = Overlay(self.image, posText, int(self.i.startBox.value() * 1000), int(self.i.endBox.value() * 1000), self.i.heightBox.value())
+        command = ImageAction(before, before + [overlay], self.workspace.timelineLogic)
         self.workspace.timelineLogic.undoStack.push(command)
 
     def render(self):
-        fullName = QFileDialog.getSaveFileName(self, 'Render', QDir().currentPath(), 'Video(.mp4)')[0]
-        while os.path.exists(fullName + '.mp4'):
+        self.r = RenderDialog()
+        self.r.btn.rejected.connect(self.r.close)
+        self.r.btn.accepted.connect(self.putRender)
+        self.r.show()
+
+    def putRender(self):
+        self.r.close()
+        profile = self.r.profileBox.currentText().lower()
+        mode = self.r.modeBox.currentText().lower()
+        container = containers[self.r.containerBox.currentIndex()]
+        targets = [target for target, box in self.r.targetBoxes.items() if box.isChecked()] if mode == 'export' else []
+        if mode == 'export' and not targets:
+            return
+        extension = '.m3u8' if container == 'hls' else '.mp4'
+        suffixes = [f'_{target}' for target in targets] or ['']
+        fullName = QFileDialog.getSaveFileName(self, 'Render', QDir().currentPath(), f'Video({extension})')[0]
+        while any(os.path.exists(fullName + suffix + extension) for suffix in suffixes):
             message = QMessageBox.warning(self, 'Warning', 'The file with the same name already exists.\nChoose another name.')
-            fullName = QFileDialog.getSaveFileName(self, 'Render', QDir().currentPath(), 'Video(.mp4)')[0]
+            fullName = QFileDialog.getSaveFileName(self, 'Render', QDir().currentPath(), f'Video({extension})')[0]
         if fullName != '':
-            self.workspace.timelineLogic.render(self.file, fullName)
-            message = QMessageBox.information(self, 'Rendering', '<font size=5> Ready! </font>')
+            self.renderThread.addJob(self.workspace.timelineLogic, self.file, fullName, mode, profile, container, targets)
+            self.renderProgress.setValue(0)
+            self.renderText.setText('Waiting')
+            self.showRenderStatus(True)
+
+    def cancelRender(self):
+        self.renderThread.cancel()
+
+    def renderProgressChanged(self, stage, percent, fps, eta):
+        self.renderProgress.setValue(int(percent))
+        text = f'{stage.capitalize()}: {percent:.0f}%, {fps:.0f} fps'
+        if eta >= 0:
+            text += f', {int(eta) // 60}:{int(eta) % 60:02} left'
+        if self.queued:
+            text += f' ({self.queued} queued)'
+        self.renderText.setText(text)
+
+    def renderQueueChanged(self, queued):
+        self.queued = queued
+
+    def renderFinished(self, output, trace):
+        self.statusBar().showMessage(f'Rendered {output}', 5000)
+        if self.queued == 0:
+            self.showRenderStatus(False)
+        message = QMessageBox(QMessageBox.Information, 'Rendering', '<font size=5> Ready! </font>', QMessageBox.Ok, self)
+        message.setInformativeText(trace.getSummary())
+        saveButton = message.addButton('Save trace', QMessageBox.ActionRole)
+        message.exec()
+        if message.clickedButton() == saveButton:
+            self.saveTrace(output, trace)
+
+    def saveTrace(self, output, trace):
+        fileName, filter = QFileDialog.getSaveFileName(self, 'Save trace', f'{os.path.splitext(output)[0]}.trace.json', 'Chrome trace (*.trace.json);;JSON (*.json)')
+        if fileName != '':
+            trace.save(fileName, chrome=filter.startswith('Chrome'))
+
+    def renderFailed(self, output, error):
+        if self.queued == 0:
+            self.showRenderStatus(False)
+        if error == '':
+            self.statusBar().showMessage(f'Rendering {output} cancelled', 5000)
+        else:
+            message = QMessageBox.critical(self, 'Rendering', error)
 
     def undo(self):
         self.workspace.timelineLogic.undoStack.undo()
@@ -203,6 +377,56 @@ class SpeedDialog(QDialog):
         self.setLayout(vbox)
 
 
+class RenderDialog(QDialog):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle('Render')
+        self.setWindowIcon(QIcon('icons/render.png'))
+        self.setFixedSize(280, 190)
+
+        self.profileBox = QComboBox(self)
+        self.profileBox.setStyleSheet('font-size:9pt;')
+        self.profileBox.addItems([name.capitalize() for name in profiles])
+        self.profileBox.setCurrentIndex(list(profiles).index('normal'))
+
+        self.modeBox = QComboBox(self)
+        self.modeBox.setStyleSheet('font-size:9pt;')
+        self.modeBox.addItems(['Single', 'Parallel', 'Smart', 'Export'])
+        self.modeBox.currentTextChanged.connect(self.modeChanged)
+
+        self.containerBox = QComboBox(self)
+        self.containerBox.setStyleSheet('font-size:9pt;')
+        self.containerBox.addItems(['MP4', 'Fragmented MP4', 'HLS'])
+
+        form = QFormLayout()
+        form.addRow('Quality', self.profileBox)
+        form.addRow('Mode', self.modeBox)
+        form.addRow('Output', self.containerBox)
+
+        self.targetBoxes = {}
+        targets = QHBoxLayout()
+        for target in exportTargets:
+            self.targetBoxes[target] = QCheckBox(target.capitalize(), self)
+            self.targetBoxes[target].setChecked(True)
+            targets.addWidget(self.targetBoxes[target])
+        form.addRow('Variants', targets)
+        self.modeChanged(self.modeBox.currentText())
+
+        self.btn = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+
+        vbox = QVBoxLayout()
+        vbox.addLayout(form)
+        vbox.addStretch(1)
+        vbox.addWidget(self.btn)
+        self.setLayout(vbox)
+
+    def modeChanged(self, mode):
+        export = mode == 'Export'
+        self.profileBox.setEnabled(not export)
+        for box in self.targetBoxes.values():
+            box.setEnabled(export)
+
+
 class ImageDialog(QDialog):
     def __init__(self, image):
         super().__init__()
@@ -254,6 +478,24 @@ class ImageDialog(QDialog):
         hbox.addLayout(vbox1)
         hbox.addLayout(vbox2)
         hbox.addLayout(vbox3)
+        leftTop.setChecked(True)
+
+        self.startBox = QDoubleSpinBox(self)
+        self.startBox.setRange(0, 24 * 3600)
+        self.startBox.setSuffix(' s')
+        self.endBox = QDoubleSpinBox(self)
+        self.endBox.setRange(0, 24 * 3600)
+        self.endBox.setSuffix(' s')
+        self.endBox.setSpecialValueText('End of video')
+        self.heightBox = QSpinBox(self)
+        self.heightBox.setRange(0, 4320)
+        self.heightBox.setSuffix(' px')
+        self.heightBox.setSpecialValueText('Original size')
+
+        form = QFormLayout()
+        form.addRow('Show from', self.startBox)
+        form.addRow('Show until', self.endBox)
+        form.addRow('Height', self.heightBox)
 
         vbox = QVBoxLayout()
         vbox.addWidget(info)
@@ -261,6 +503,8 @@ class ImageDialog(QDialog):
         vbox.addWidget(text)
         vbox.addStretch(1)
         vbox.addLayout(hbox)
+        vbox.addStretch(1)
+        vbox.addLayout(form)
         vbox.addStretch(2)
         vbox.addWidget(self.btn)
 
@@ -290,11 +534,12 @@ class ImageAction(QUndoCommand):
         self.logic = logic
 
     def undo(self):
-        self.logic.imageToAdd = self.before
+        self.logic.overlays = self.before
 
     def redo(self):
-        self.logic.imageToAdd = self.after
-        self.setText(f'Add image {os.path.split(self.after[0])[1]} at {self.after[1]}')
+        self.logic.overlays = self.after
+        overlay = self.after[-1]
+        self.setText(f'Add image {os.path.split(overlay.image)[1]} at {overlay.position}')
 
 
 if __name__ == '__main__':
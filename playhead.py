@@ -0,0 +1,90 @@
+import time
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QGuiApplication
+from edit import getFrame, getFrameTime
+
+
+def getRefreshRate():
+    screen = QGuiApplication.primaryScreen()
+    rate = screen.refreshRate() if screen is not None else 0
+    return rate if rate > 1 else 60
+
+
+class PlayheadController(QObject):
+    positionChanged = pyqtSignal(int)
+    settled = pyqtSignal(int)
+    defaultFps = 25
+    seekInterval = 50
+
+    def __init__(self, player):
+        super().__init__()
+        self.player = player
+        self.fps = 0
+        self.position = 0
+        self.seekTarget = None
+        self.seeking = False
+        self.lastUpdate = 0
+        self.lastSeek = 0
+        self.interval = 0
+
+        self.updateTimer = self.createTimer(self.flushPosition)
+        self.seekTimer = self.createTimer(self.flushSeek)
+        self.player.positionChanged.connect(self.playerPositionChanged)
+        self.setFrameRate(0)
+
+    def createTimer(self, slot):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setTimerType(Qt.PreciseTimer)
+        timer.timeout.connect(slot)
+        return timer
+
+    def setFrameRate(self, fps):
+        self.fps = fps
+        self.interval = 1000 / min(fps or self.defaultFps, getRefreshRate())
+        self.player.setNotifyInterval(max(1, int(self.interval)))
+
+    def getFrameRate(self):
+        return self.fps or self.defaultFps
+
+    def getFrame(self, position):
+        return getFrame(position, self.getFrameRate())
+
+    def getFrameTime(self, frame):
+        return getFrameTime(frame, self.getFrameRate())
+
+    def schedule(self, timer, last, interval):
+        if not timer.isActive():
+            elapsed = time.monotonic() * 1000 - last
+            timer.start(max(0, int(interval - elapsed)))
+
+    def playerPositionChanged(self, position):
+        if self.seekTarget is not None:
+            return
+        self.position = position
+        self.schedule(self.updateTimer, self.lastUpdate, self.interval)
+        if self.seeking:
+            self.seeking = False
+            self.settled.emit(position)
+
+    def flushPosition(self):
+        self.lastUpdate = time.monotonic() * 1000
+        self.positionChanged.emit(self.position)
+
+    def seek(self, position):
+        self.position = self.seekTarget = max(0, int(position))
+        self.schedule(self.updateTimer, self.lastUpdate, self.interval)
+        self.schedule(self.seekTimer, self.lastSeek, self.seekInterval)
+
+    def flushSeek(self):
+        target, self.seekTarget = self.seekTarget, None
+        if target is None:
+            return
+        self.lastSeek = time.monotonic() * 1000
+        self.seeking = True
+        self.player.setPosition(target)
+
+    def step(self, frames):
+        if self.player.state() == self.player.PlayingState:
+            self.player.pause()
+        self.seek(self.getFrameTime(max(0, self.getFrame(self.position) + frames)))
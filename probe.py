@@ -0,0 +1,87 @@
+import json, os, threading
+from cache import cacheDir, getFileId
+from render import runFfmpeg
+
+probes = {}
+probesLock = threading.Lock()
+
+
+class MediaInfo:
+    fields = ('codec', 'width', 'height', 'fps', 'timebase', 'pixFmt', 'duration', 'audioCodec', 'sampleRate', 'channels')
+
+    def __init__(self, codec='', width=0, height=0, fps='', timebase='', pixFmt='', duration=0, audioCodec='', sampleRate=0, channels=0):
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.timebase = timebase
+        self.pixFmt = pixFmt
+        self.duration = duration
+        self.audioCodec = audioCodec
+        self.sampleRate = sampleRate
+        self.channels = channels
+
+    @classmethod
+    def parse(cls, data):
+        info = cls(duration=int(float(data.get('format', {}).get('duration', 0)) * 1000))
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video' and not info.codec:
+                info.codec = stream.get('codec_name', '')
+                info.width = stream.get('width', 0)
+                info.height = stream.get('height', 0)
+                info.fps = stream.get('avg_frame_rate') or stream.get('r_frame_rate', '')
+                info.timebase = stream.get('time_base', '')
+                info.pixFmt = stream.get('pix_fmt', '')
+            elif stream.get('codec_type') == 'audio' and not info.audioCodec:
+                info.audioCodec = stream.get('codec_name', '')
+                info.sampleRate = int(stream.get('sample_rate', 0))
+                info.channels = stream.get('channels', 0)
+        return info
+
+    def getFps(self):
+        numerator, _, denominator = self.fps.partition('/')
+        try:
+            return float(numerator) / float(denominator or 1)
+        except (ValueError, ZeroDivisionError):
+            return 0
+
+    def getFormat(self):
+        return (self.codec, self.width, self.height, self.fps, self.timebase, self.pixFmt, self.audioCodec, self.sampleRate, self.channels)
+
+    def toJson(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+
+def probe(file):
+    fileId = getFileId(file)
+    with probesLock:
+        if fileId in probes:
+            return probes[fileId]
+
+    path = os.path.join(cacheDir, 'probes', f'{fileId}.json')
+    try:
+        with open(path) as f:
+            info = MediaInfo(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        output = runFfmpeg(['ffprobe', '-v', 'error', '-show_entries',
+                            'format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate,time_base,pix_fmt,sample_rate,channels',
+                            '-of', 'json', file], 'ffprobe')
+        info = MediaInfo.parse(json.loads(output))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(info.toJson(), f)
+        os.replace(temp, path)
+
+    with probesLock:
+        probes[fileId] = info
+    return info
+
+
+def hasAudio(file):
+    return bool(probe(file).audioCodec)
+
+
+def isCompatible(files):
+    formats = {probe(file).getFormat() for file in files}
+    return len(formats) <= 1
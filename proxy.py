@@ -0,0 +1,38 @@
+import os
+from cache import cacheDir, getFileId
+from render import runFfmpeg
+
+
+class Proxy:
+    height = 540
+    maxBitrate = 8_000_000
+    maxHeight = 1080
+
+    def __init__(self, file):
+        self.file = file
+        self.path = os.path.join(cacheDir, 'proxies', f'{getFileId(file)}_{self.height}.mp4')
+
+    @classmethod
+    def isNeeded(cls, file, duration, height=0):
+        if duration <= 0:
+            return False
+        bitrate = os.path.getsize(file) * 8 / (duration / 1000)
+        return bitrate > cls.maxBitrate or height > cls.maxHeight
+
+    def isReady(self):
+        return os.path.exists(self.path)
+
+    def getCmd(self, output):
+        return ['ffmpeg', '-y', '-i', self.file, '-map', '0:v:0', '-map', '0:a?',
+                '-vf', f'scale=-2:{self.height}', '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'fastdecode',
+                '-crf', '28', '-g', '10', '-bf', '0', '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart', output]
+
+    def build(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path + '.part.mp4'
+        try:
+            runFfmpeg(self.getCmd(temp), 'proxy')
+            os.replace(temp, self.path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
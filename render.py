@@ -0,0 +1,623 @@
+import glob, os, subprocess, tempfile, threading, time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from cache import cacheDir, getFileId
+from tracing import RenderTrace, waitProcess
+
+positions = {
+    'Left-Top': ('0', '0'),
+    'Top': ('w/2', '0'),
+    'Right-Top': ('w', '0'),
+    'Left': ('0', 'h/2'),
+    'Center': ('w/2', 'h/2'),
+    'Right': ('w', 'h/2'),
+    'Left-Bottom': ('0', 'h'),
+    'Bottom': ('w/2', 'h'),
+    'Right-Bottom': ('w', 'h')
+}
+
+
+def getCmdPos(width, height):
+    x = '0'
+    y = '0'
+    if width != '0':
+        x = f'main_{width}-overlay_{width}'
+    if height != '0':
+        y = f'main_{height}-overlay_{height}'
+    return x + ':' + y
+
+
+def getConcatPath(path):
+    # the concat demuxer resolves relative entries against the list's own directory
+    return os.path.abspath(path).replace("'", "'\\''")
+
+
+class Overlay:
+    def __init__(self, image, position='Left-Top', start=0, end=0, height=0):
+        self.image = image
+        self.position = position
+        self.start = start
+        self.end = end
+        self.height = height
+
+    def isActive(self, time):
+        return self.start <= time and (self.end == 0 or time < self.end)
+
+    def getEnable(self):
+        if self.start == 0 and self.end == 0:
+            return ''
+        if self.end == 0:
+            return f":enable='gte(t,{self.start / 1000})'"
+        return f":enable='between(t,{self.start / 1000},{self.end / 1000})'"
+
+    def getScaledPath(self):
+        if self.height == 0:
+            return self.image
+        return os.path.join(cacheDir, 'overlays', f'{getFileId(self.image)}_{self.height}.png')
+
+    def prepare(self):
+        path = self.getScaledPath()
+        if path != self.image and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = path + '.part.png'
+            runFfmpeg(['ffmpeg', '-y', '-i', self.image, '-vf', f'scale=-1:{self.height}', '-frames:v', '1', temp], 'overlay')
+            os.replace(temp, path)
+        return path
+
+
+class RenderProfile:
+    def __init__(self, name, height=0, preset='medium', crf=23, audioBitrate='128k', video=True):
+        self.name = name
+        self.height = height
+        self.preset = preset
+        self.crf = crf
+        self.audioBitrate = audioBitrate
+        self.video = video
+
+    def getScaleFilter(self):
+        if self.height == 0:
+            return ''
+        return f"scale=-2:'min({self.height},ih)'"
+
+    def getEncodeArgs(self):
+        if not self.video:
+            return ['-vn', '-c:a', 'aac', '-b:a', self.audioBitrate]
+        return ['-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf), '-c:a', 'aac', '-b:a', self.audioBitrate]
+
+    def getKey(self):
+        return (self.height, self.preset, self.crf, self.audioBitrate)
+
+
+profiles = {
+    'draft': RenderProfile('draft', 480, 'ultrafast', 32, '96k'),
+    'normal': RenderProfile('normal'),
+    'final': RenderProfile('final', 0, 'slow', 18, '192k')
+}
+
+
+exportTargets = {
+    '1080p': RenderProfile('1080p', 1080),
+    '720p': RenderProfile('720p', 720),
+    '480p': RenderProfile('480p', 480, 'medium', 26, '96k'),
+    'audio': RenderProfile('audio', 0, audioBitrate='160k', video=False)
+}
+
+containers = ('mp4', 'fmp4', 'hls')
+
+
+class RenderError(Exception):
+    def __init__(self, errors):
+        super().__init__('\n'.join(f'{name}: exited with code {code}\n{log}' for name, code, log in errors))
+        self.errors = errors
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class ProcessGroup:
+    def __init__(self):
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.killed = False
+
+    def add(self, process):
+        with self.lock:
+            self.processes.add(process)
+            if self.killed:
+                process.kill()
+
+    def discard(self, process):
+        with self.lock:
+            self.processes.discard(process)
+
+    def kill(self, graceful=False):
+        with self.lock:
+            self.killed = True
+            for process in self.processes:
+                if graceful:
+                    process.terminate()
+                else:
+                    process.kill()
+
+
+class Progress:
+    def __init__(self, callback, stage, total):
+        self.callback = callback
+        self.stage = stage
+        self.total = total or 1
+        self.done = {}
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, key, done, fps=0):
+        with self.lock:
+            self.done[key] = done
+            percent = min(100, 100 * sum(self.done.values()) / self.total)
+            elapsed = time.monotonic() - self.started
+            eta = elapsed * (100 - percent) / percent if percent > 0 else None
+            self.callback(self.stage, percent, fps, eta)
+
+    def getReporter(self, key, duration):
+        def report(values):
+            try:
+                fps = float(values.get('fps', 0))
+            except ValueError:
+                fps = 0
+            if values.get('progress') == 'end':
+                self.update(key, duration, fps)
+            elif values.get('out_time_us', 'N/A') != 'N/A':
+                self.update(key, min(duration, max(0, int(values['out_time_us']) / 1000)), fps)
+        return report
+
+
+def runFfmpeg(cmd, name='render', progress=None, processes=None, trace=None):
+    cmd = cmd[:1] + ['-hide_banner'] + cmd[1:]
+    if progress is not None:
+        cmd = cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    with tempfile.TemporaryFile() as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=log, text=True, errors='replace')
+        if processes is not None:
+            processes.add(process)
+        try:
+            if progress is None:
+                out = process.stdout.read()
+            else:
+                out = ''
+                values = {}
+                for line in process.stdout:
+                    key, _, value = line.strip().partition('=')
+                    values[key] = value
+                    if key == 'progress':
+                        progress(values)
+            if trace is None:
+                process.wait()
+            else:
+                usage, io = waitProcess(process)
+                trace.add(name, cmd, started, time.perf_counter(), usage, io, process.returncode)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if processes is not None:
+                processes.discard(process)
+
+        if process.returncode != 0:
+            log.seek(0)
+            tail = '\n'.join(log.read().decode(errors='replace').splitlines()[-10:])
+            raise RenderError([(name, process.returncode, tail)])
+    return out
+
+
+class RenderEngine:
+    fragmentSeconds = 4
+
+    def __init__(self, blocks, speed=0, overlays=(), workers=None, threads=None, cache=None, progress=None, profile='normal', container='mp4'):
+        self.blocks = [(block[0], block[1]) for block in blocks]
+        self.sources = [block[2] if len(block) > 2 else '' for block in blocks]
+        self.format = None
+        self.silent = set()
+        self.audio = True
+        self.speed = speed
+        self.overlays = list(overlays)
+        self.profile = profiles[profile]
+        self.container = container
+        self.farm = None
+        self.cache = cache
+        self.progress = progress
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.threadLimit = threads
+        self.processes = ProcessGroup()
+        self.trace = None
+
+    def cancel(self):
+        self.processes.kill(graceful=self.isStreaming())
+
+    def isStreaming(self):
+        return self.container != 'mp4'
+
+    def getOutputPath(self, output):
+        if self.container == 'hls':
+            return f'{output}.m3u8'
+        return f'{output}.mp4'
+
+    def getOutputFiles(self, output):
+        files = [self.getOutputPath(output)]
+        if self.container == 'hls':
+            files += sorted(glob.glob(f'{glob.escape(output)}_[0-9][0-9][0-9][0-9][0-9].ts'))
+        return [file for file in files if os.path.exists(file)]
+
+    def getOutputArgs(self, output, encode=True):
+        args = []
+        if encode and self.isStreaming():
+            args += ['-force_key_frames', f'expr:gte(t,n_forced*{self.fragmentSeconds})']
+        if self.container == 'fmp4':
+            args += ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+        elif self.container == 'hls':
+            args += ['-f', 'hls', '-hls_time', str(self.fragmentSeconds), '-hls_playlist_type', 'event',
+                     '-hls_flags', 'independent_segments', '-hls_segment_filename', f'{output}_%05d.ts']
+        return args + [self.getOutputPath(output)]
+
+    def finishPlaylist(self, output):
+        path = self.getOutputPath(output)
+        if self.container != 'hls' or not os.path.exists(path):
+            return
+        with open(path, 'r+') as f:
+            if '#EXT-X-ENDLIST' not in f.read():
+                f.write('#EXT-X-ENDLIST\n')
+
+    def getOutputDuration(self):
+        duration = sum(duration for start, duration in self.blocks)
+        if self.speed != 0:
+            duration /= self.speed
+        return duration
+
+    def getProgress(self, stage, total):
+        if self.progress is None:
+            return None
+        return Progress(self.progress, stage, total)
+
+    def run(self, cmd, name, progress=None):
+        if self.processes.killed:
+            raise RenderCancelled()
+        try:
+            return runFfmpeg(cmd, name, progress, self.processes, self.trace)
+        except RenderError:
+            if self.processes.killed:
+                raise RenderCancelled()
+            raise
+
+    def getSources(self, file):
+        return [source or file for source in self.sources]
+
+    def getInputs(self, file):
+        return list(dict.fromkeys(self.getSources(file)))
+
+    def prepareSources(self, file):
+        from probe import hasAudio, isCompatible, probe
+        inputs = self.getInputs(file)
+        self.format = None
+        self.silent = {source for source in inputs if not hasAudio(source)}
+        self.audio = len(self.silent) < len(inputs)
+        if len(inputs) > 1:
+            if not isCompatible(inputs):
+                info = probe(self.getSources(file)[0])
+                self.format = (info.width, info.height, info.fps or '30')
+
+    def getNormalizeFilter(self):
+        if self.format is None:
+            return ''
+        width, height, fps = self.format
+        return f'scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}'
+
+    def hasEffects(self):
+        return self.speed != 0 or len(self.overlays) > 0
+
+    def getFilterGraph(self, file='', scale=True):
+        inputs = self.getInputs(file)
+        normalize = ',' + self.getNormalizeFilter() if self.format is not None else ''
+        filters = []
+        streams = ''
+        for i, ((start, duration), source) in enumerate(zip(self.blocks, self.getSources(file))):
+            k = inputs.index(source)
+            filters.append(f'[{k}:v]trim=start={start / 1000}:duration={duration / 1000},setpts=PTS-STARTPTS{normalize}[v{i}]')
+            if not self.audio:
+                streams += f'[v{i}]'
+                continue
+            if source in self.silent:
+                filters.append(f'anullsrc=r=48000:cl=stereo:d={duration / 1000}[a{i}]')
+            else:
+                filters.append(f'[{k}:a]atrim=start={start / 1000}:duration={duration / 1000},asetpts=PTS-STARTPTS[a{i}]')
+            streams += f'[v{i}][a{i}]'
+        if self.audio:
+            filters.append(f'{streams}concat=n={len(self.blocks)}:v=1:a=1[v][a]')
+        else:
+            filters.append(f'{streams}concat=n={len(self.blocks)}:v=1:a=0[v]')
+        effects, video, audio = self.getEffectsGraph('[v]', '[a]' if self.audio else None, len(inputs))
+        if scale and self.profile.getScaleFilter():
+            effects.append(f'{video}{self.profile.getScaleFilter()}[vz]')
+            video = '[vz]'
+        return ';'.join(filters + effects), video, audio
+
+    def getEffectsGraph(self, video, audio, imageInput=1):
+        filters = []
+        if self.speed != 0:
+            filters.append(f'{video}setpts={1 / self.speed}*PTS[vs]')
+            video = '[vs]'
+            if audio is not None:
+                filters.append(f'{audio}atempo={self.speed}[as]')
+                audio = '[as]'
+
+        for i, overlay in enumerate(self.overlays):
+            pos = getCmdPos(*positions[overlay.position])
+            label = '[vo]' if i == len(self.overlays) - 1 else f'[vo{i}]'
+            filters.append(f'{video}[{imageInput + i}:v]overlay={pos}{overlay.getEnable()}{label}')
+            video = label
+
+        return filters, video, audio
+
+    def getRenderCmd(self, file, output):
+        graph, video, audio = self.getFilterGraph(file)
+        cmd = ['ffmpeg', '-y']
+        for source in self.getInputs(file):
+            cmd += ['-i', source]
+        for overlay in self.overlays:
+            cmd += ['-i', overlay.getScaledPath()]
+        cmd += ['-filter_complex', graph] + self.getThreadArgs() + self.profile.getEncodeArgs()
+        cmd += ['-map', video] + (['-map', audio] if audio is not None else [])
+        return cmd + ['-fps_mode', 'passthrough'] + self.getOutputArgs(output)
+
+    def getThreadArgs(self):
+        if self.threadLimit is None:
+            return []
+        return ['-threads', str(self.threadLimit)]
+
+    def getSplitGraph(self, stream, count, prefix, filter='split'):
+        if count == 1:
+            return [], [stream]
+        labels = [f'[{prefix}{i}]' for i in range(count)]
+        return [f'{stream}{filter}={count}{"".join(labels)}'], labels
+
+    def getExportCmd(self, file, output, targets):
+        duplicates = sorted({target for target in targets if targets.count(target) > 1})
+        if duplicates:
+            raise RenderError([('export', -1, f'duplicate export targets: {", ".join(duplicates)}')])
+        graph, video, audio = self.getFilterGraph(file, scale=False)
+        filters = [graph]
+        videoTargets = [target for target in targets if exportTargets[target].video]
+        if videoTargets:
+            splitFilters, videos = self.getSplitGraph(video, len(videoTargets), 'x')
+            filters += splitFilters
+        else:
+            filters.append(f'{video}nullsink')
+        if audio is None:
+            if len(videoTargets) < len(targets):
+                raise RenderError([('export', -1, 'the timeline has no audio for an audio-only target')])
+            audios = [None] * len(targets)
+        else:
+            audioFilters, audios = self.getSplitGraph(audio, len(targets), 'y', 'asplit')
+            filters += audioFilters
+
+        cmd = ['ffmpeg', '-y']
+        for source in self.getInputs(file):
+            cmd += ['-i', source]
+        for overlay in self.overlays:
+            cmd += ['-i', overlay.getScaledPath()]
+        outputs = []
+        for target, audio in zip(targets, audios):
+            profile = exportTargets[target]
+            args = []
+            if profile.video:
+                video = videos.pop(0)
+                if profile.getScaleFilter():
+                    filters.append(f'{video}{profile.getScaleFilter()}[{target}]')
+                    video = f'[{target}]'
+                args += ['-map', video, '-fps_mode', 'passthrough']
+            if audio is not None:
+                args += ['-map', audio]
+            args += self.getThreadArgs() + profile.getEncodeArgs()
+            outputs += args + self.getOutputArgs(f'{output}_{target}', profile.video)
+        return cmd + ['-filter_complex', ';'.join(filters)] + outputs
+
+    def getCutCmd(self, start, duration, file, result, encodeArgs=(), silence=False):
+        cmd = ['ffmpeg', '-y', '-ss', str(start / 1000), '-i', file]
+        if silence:
+            cmd += ['-f', 'lavfi', '-i', 'anullsrc=r=48000:cl=stereo', '-map', '0:v:0', '-map', '1:a']
+        cmd += ['-t', str(duration / 1000), '-threads', str(self.threads)]
+        return cmd + list(encodeArgs) + [result]
+
+    def getJoinCmd(self, files, output):
+        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', files]
+        if not self.hasEffects():
+            return cmd + ['-c', 'copy'] + self.getOutputArgs(output, encode=False)
+
+        for overlay in self.overlays:
+            cmd += ['-i', overlay.getScaledPath()]
+        filters, video, audio = self.getEffectsGraph('[0:v]', '[0:a]' if self.audio else None)
+        cmd += ['-filter_complex', ';'.join(filters)] + self.profile.getEncodeArgs()
+        cmd += ['-map', video]
+        if audio is not None:
+            cmd += ['-map', '0:a' if audio == '[0:a]' else audio]
+        return cmd + ['-fps_mode', 'passthrough'] + self.getOutputArgs(output)
+
+    def getSmartParts(self, start, duration, keyframes):
+        end = start + duration
+        first = keyframes.after(start)
+        last = keyframes.before(end)
+        if first is None or last is None or first >= last:
+            return [(start, duration, False)]
+
+        parts = []
+        if first - start >= 1:
+            parts.append((start, first - start, False))
+        parts.append((first, last - first, True))
+        if end - last >= 1:
+            parts.append((last, end - last, False))
+        return parts
+
+    def getChunks(self, start, duration, chunkLength, keyframes=None):
+        end = start + duration
+        chunks = []
+        while chunkLength and end - start > chunkLength * 1.5:
+            boundary = start + chunkLength
+            if keyframes is not None:
+                boundary = keyframes.after(boundary)
+                if boundary is None or end - boundary < chunkLength / 2:
+                    break
+            chunks.append((start, boundary - start))
+            start = boundary
+        return chunks + [(start, end - start)]
+
+    def getCutJobs(self, file, temp, chunkLength=0, keyframes=None):
+        encodeArgs = self.profile.getEncodeArgs()
+        videoFilters = [f for f in (self.getNormalizeFilter(), self.profile.getScaleFilter()) if f]
+        if videoFilters:
+            encodeArgs = ['-vf', ','.join(videoFilters)] + encodeArgs
+        if self.format is not None:
+            encodeArgs += ['-ar', '48000', '-ac', '2']
+        jobs = []
+        for i, ((start, duration), source) in enumerate(zip(self.blocks, self.getSources(file))):
+            chunks = self.getChunks(start, duration, chunkLength, keyframes and keyframes.get(source))
+            for j, (chunkStart, chunkDuration) in enumerate(chunks):
+                name, segment = (f'{i}', f'{i}.mp4') if len(chunks) == 1 else (f'{i}.{j}', f'{i}_{j}.mp4')
+                segment = os.path.join(temp, segment)
+                silence = self.audio and source in self.silent
+                cmd = self.getCutCmd(chunkStart, chunkDuration, source, segment, encodeArgs, silence)
+                jobs.append((f'segment {name}', cmd, segment, ('encode', chunkStart, chunkDuration, self.profile.getKey(), self.format, silence), source))
+        return jobs
+
+    def getSmartJobs(self, file, temp, keyframes):
+        jobs = []
+        for i, ((start, duration), source) in enumerate(zip(self.blocks, self.getSources(file))):
+            index = keyframes[source]
+            for j, (partStart, partDuration, copy) in enumerate(self.getSmartParts(start, duration, index)):
+                if copy:
+                    outpoint = index.getDecodeTime(partStart + partDuration)
+                    jobs.append((f'segment {i}.{j}', None, source, ('copy', partStart, partDuration, outpoint), source))
+                    continue
+                segment = os.path.join(temp, f'{i}_{j}.mp4')
+                cmd = self.getCutCmd(partStart, partDuration, source, segment, self.profile.getEncodeArgs() + index.getEncodeArgs())
+                params = ('encode', partStart, partDuration, self.profile.getKey(), tuple(index.getEncodeArgs()))
+                jobs.append((f'segment {i}.{j}', cmd, segment, params, source))
+        return jobs
+
+    def canSmartCut(self, file, keyframes):
+        if keyframes is None or self.format is not None or self.profile.getScaleFilter():
+            return False
+        return all(source in keyframes and keyframes[source].canCopy() for source in self.getInputs(file))
+
+    def getOutputs(self, output, mode='single', targets=()):
+        return [f'{output}_{target}' for target in targets] if mode == 'export' else [output]
+
+    def render(self, file, output, mode='single', keyframes=None, targets=()):
+        outputs = self.getOutputs(output, mode, targets)
+        existed = [os.path.exists(self.getOutputPath(path)) for path in outputs]
+        self.trace = RenderTrace()
+        try:
+            self.prepareSources(file)
+            for overlay in self.overlays:
+                overlay.prepare()
+            if mode in ('single', 'export'):
+                name = 'render' if mode == 'single' else 'export'
+                cmd = self.getRenderCmd(file, output) if mode == 'single' else self.getExportCmd(file, output, targets)
+                progress = self.getProgress(name, self.getOutputDuration())
+                self.run(cmd, name, progress and progress.getReporter(0, self.getOutputDuration()))
+            else:
+                self.renderSegments(file, output, mode, keyframes)
+        except RenderCancelled:
+            for path, pathExisted in zip(outputs, existed):
+                if self.isStreaming():
+                    self.finishPlaylist(path)
+                elif not pathExisted:
+                    self.removeOutput(path)
+            raise
+        except RenderError:
+            for path, pathExisted in zip(outputs, existed):
+                if not pathExisted:
+                    self.removeOutput(path)
+            raise
+        finally:
+            self.trace.finish()
+
+    def removeOutput(self, output):
+        for file in self.getOutputFiles(output):
+            os.remove(file)
+
+    def renderSegments(self, file, output, mode, keyframes):
+        farm = self.farm if mode == 'farm' else None
+        with tempfile.TemporaryDirectory(dir=farm and farm.workDir) as temp:
+            if keyframes is not None and not isinstance(keyframes, dict):
+                keyframes = {file: keyframes}
+            if mode == 'smart' and self.canSmartCut(file, keyframes):
+                jobs = self.getSmartJobs(file, temp, keyframes)
+            elif farm is not None:
+                jobs = self.getCutJobs(file, temp, farm.chunkLength, keyframes)
+            else:
+                jobs = self.getCutJobs(file, temp)
+            segments = self.runJobs(jobs, farm)
+
+            files = os.path.join(temp, 'files.txt')
+            with open(files, 'w') as f:
+                for (name, cmd, segment, params, source), path in zip(jobs, segments):
+                    f.write(f"file '{getConcatPath(path)}'\n")
+                    if cmd is None:
+                        f.write(f'inpoint {params[1] / 1000}\noutpoint {params[3] / 1000}\nduration {params[2] / 1000}\n')
+            progress = self.getProgress('join', self.getOutputDuration())
+            self.run(self.getJoinCmd(files, output), 'join', progress and progress.getReporter(0, self.getOutputDuration()))
+
+        if self.cache is not None:
+            self.cache.evict()
+
+    def runJob(self, name, cmd, segment, key, progress):
+        self.run(cmd, name, progress)
+        if key is None:
+            return segment
+        return self.cache.put(key, segment)
+
+    def runJobs(self, jobs, farm=None):
+        segments = [None] * len(jobs)
+        pending = []
+        progress = self.getProgress('segments', sum(params[2] for name, cmd, segment, params, source in jobs))
+        for i, (name, cmd, segment, params, source) in enumerate(jobs):
+            key = None
+            if cmd is None:
+                segments[i] = segment
+            elif self.cache is not None:
+                key = self.cache.getKey(getFileId(source), params)
+                segments[i] = self.cache.get(key)
+            if segments[i] is None:
+                pending.append((i, name, cmd, segment, key, progress and progress.getReporter(i, params[2])))
+            elif progress is not None:
+                progress.update(i, params[2])
+
+        if farm is not None:
+            farm.runChunks([(name, cmd, reporter, segment) for i, name, cmd, segment, key, reporter in pending], self.processes, self.trace)
+            for i, name, cmd, segment, key, reporter in pending:
+                segments[i] = segment if key is None else self.cache.put(key, segment)
+            return segments
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.runJob, name, cmd, segment, key, reporter) for i, name, cmd, segment, key, reporter in pending]
+            done, running = wait(futures, return_when=FIRST_EXCEPTION)
+            cancelled = self.processes.killed
+            if running:
+                for future in running:
+                    future.cancel()
+                self.processes.kill()
+
+        if cancelled:
+            raise RenderCancelled()
+        errors = []
+        for (i, name, cmd, segment, key, reporter), future in zip(pending, futures):
+            error = None if future.cancelled() else future.exception()
+            if isinstance(error, RenderError):
+                errors += error.errors
+            elif error is not None and not isinstance(error, RenderCancelled):
+                errors.append((name, -1, f'{type(error).__name__}: {error}'))
+        if errors:
+            raise RenderError(errors)
+
+        for (i, name, cmd, segment, key, reporter), future in zip(pending, futures):
+            segments[i] = future.result()
+        return segments
@@ -0,0 +1,144 @@
+import bisect, marshal, zlib
+
+
+class Segment:
+    __slots__ = ('start', 'duration', 'x', 'source')
+
+    def __init__(self, start, duration, x, source=''):
+        self.start = start
+        self.duration = duration
+        self.x = x
+        self.source = source
+
+    def end(self):
+        return self.x + self.duration
+
+
+class Snapshot:
+    __slots__ = ('data', 'compressed')
+
+    def __init__(self, segments):
+        self.data = marshal.dumps([value for segment in segments for value in (segment.start, segment.duration, segment.x, segment.source)])
+        self.compressed = False
+
+    def __len__(self):
+        return len(self.data)
+
+    def compress(self):
+        if not self.compressed:
+            self.data = zlib.compress(self.data)
+            self.compressed = True
+
+    def restore(self):
+        values = marshal.loads(zlib.decompress(self.data) if self.compressed else self.data)
+        return [Segment(*values[i:i + 4]) for i in range(0, len(values), 4)]
+
+
+class SegmentModel:
+    def __init__(self, duration=0):
+        self.duration = duration
+        self.segments = []
+        self.xs = []
+        if duration > 0:
+            self.replace(0, 0, [Segment(0, duration, 0)])
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __getitem__(self, index):
+        return self.segments[index]
+
+    def find(self, x):
+        index = bisect.bisect_right(self.xs, x) - 1
+        if index >= 0 and x < self.segments[index].end():
+            return index
+        return -1
+
+    def findSource(self, position, segments=None):
+        segments = self.segments if segments is None else segments
+        low, high = 0, len(segments)
+        while low < high:
+            middle = (low + high) // 2
+            if segments[middle].start <= position:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    def indexOf(self, segment):
+        index = bisect.bisect_left(self.xs, segment.x)
+        if index < len(self.segments) and self.segments[index] is segment:
+            return index
+        raise ValueError('segment is not in the timeline')
+
+    def getRange(self, x1, x2):
+        first = max(0, bisect.bisect_right(self.xs, x1) - 1)
+        if first < len(self.segments) and self.segments[first].end() <= x1:
+            first += 1
+        return first, bisect.bisect_left(self.xs, x2)
+
+    def replace(self, index, count, segments):
+        removed = self.segments[index:index + count]
+        self.segments[index:index + count] = segments
+        self.xs[index:index + count] = [segment.x for segment in segments]
+        return removed
+
+    def removeAt(self, indexes):
+        removed = set(indexes)
+        kept = [segment for i, segment in enumerate(self.segments) if i not in removed]
+        segments = [self.segments[i] for i in sorted(removed)]
+        self.segments = kept
+        self.xs = [segment.x for segment in kept]
+        return segments
+
+    def insertAt(self, indexes, segments):
+        merged = []
+        rest = iter(self.segments)
+        for index, segment in sorted(zip(indexes, segments), key=lambda pair: pair[0]):
+            while len(merged) < index:
+                merged.append(next(rest))
+            merged.append(segment)
+        merged.extend(rest)
+        self.segments = merged
+        self.xs = [segment.x for segment in merged]
+
+    def move(self, index, x):
+        self.segments[index].x = x
+        self.xs[index] = x
+
+    def getBounds(self, index):
+        low = self.segments[index - 1].end() if index > 0 else 0
+        high = self.segments[index + 1].x if index < len(self.segments) - 1 else self.duration
+        return low, high - self.segments[index].duration
+
+    def split(self, cuts, removed, source=''):
+        segments = []
+        for segment in self.segments:
+            if segment.source != source:
+                segments.append(Segment(segment.start, segment.duration, segment.x, segment.source))
+                continue
+            end = segment.start + segment.duration
+            points = [segment.start]
+            points += cuts[bisect.bisect_right(cuts, segment.start):bisect.bisect_left(cuts, end)]
+            points.append(end)
+            for start, stop in zip(points, points[1:]):
+                first = bisect.bisect_right(removed, (start,)) - 1
+                for low, high in removed[max(0, first):]:
+                    if low >= stop:
+                        break
+                    if high <= start:
+                        continue
+                    if low > start:
+                        segments.append(Segment(start, low - start, segment.x + start - segment.start, source))
+                    start = max(start, high)
+                    if start >= stop:
+                        break
+                if start < stop:
+                    segments.append(Segment(start, stop - start, segment.x + start - segment.start, source))
+        return segments
+
+    def getBlocks(self):
+        return [(segment.start, segment.duration, segment.source) if segment.source else (segment.start, segment.duration) for segment in self.segments]
+
+    def getSourceSegments(self, source=''):
+        return [segment for segment in self.segments if segment.source == source]
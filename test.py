@@ -1,12 +1,491 @@
-import unittest
-from timeline import TimelineLogic
+import os, re, shutil, subprocess, sys, tempfile, time, unittest
+cacheHome = tempfile.TemporaryDirectory()
+os.environ['XDG_CACHE_HOME'] = cacheHome.name
+from render import Overlay, ProcessGroup, RenderEngine, RenderError, getCmdPos
+from keyframes import KeyframeIndex
+from cache import SegmentCache
+from batch import EditDecisionList, renderJob
+from segments import Segment, SegmentModel, Snapshot
+from edit import EditLogic, MoveAction, getFrame
+from farm import RenderFarm
+from tracing import RenderTrace
+from probe import MediaInfo
+from playhead import PlayheadController
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QObject, QTimer, pyqtSignal
+
+canRender = shutil.which('ffmpeg') and shutil.which('ffprobe')
+
+
+def makeVideo(path, duration=4, rate=30, audio=True, args=()):
+    cmd = ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=size=64x48:rate={rate}:duration={duration}']
+    if audio:
+        cmd += ['-f', 'lavfi', '-i', f'sine=duration={duration}', '-c:a', 'aac', '-shortest']
+    subprocess.run(cmd + ['-c:v', 'libx264', '-preset', 'ultrafast'] + list(args) + [path], check=True)
+    return path
+
+
+def readVideo(path):
+    return subprocess.run(['ffmpeg', '-i', path, '-map', '0:v', '-f', 'null', '-'], capture_output=True, text=True).stderr
+
+
+def countFrames(log):
+    return int(re.findall(r'frame=\s*(\d+)', log)[-1])
 
 
 class TestBuildCmd(unittest.TestCase):
     def testRightPos(self):
-        t = TimelineLogic()
-        str = t.getCmdPos('w', 'h')
-        self.assertEqual('main_w-ovelay_w:main_h-overlay_h', str)
+        self.assertEqual('main_w-overlay_w:main_h-overlay_h', getCmdPos('w', 'h'))
+
+
+class TestRenderEngine(unittest.TestCase):
+    def testSinglePassGraph(self):
+        engine = RenderEngine([(0, 2000), (5000, 1500)], 2, [Overlay('logo.png', 'Center')])
+        graph, video, audio = engine.getFilterGraph()
+        self.assertIn('[0:v]trim=start=5.0:duration=1.5,setpts=PTS-STARTPTS[v1]', graph)
+        self.assertIn('[v0][a0][v1][a1]concat=n=2:v=1:a=1[v][a]', graph)
+        self.assertIn('[v]setpts=0.5*PTS[vs];[a]atempo=2[as]', graph)
+        self.assertIn('[vs][1:v]overlay=main_w/2-overlay_w/2:main_h/2-overlay_h/2[vo]', graph)
+        self.assertEqual(('[vo]', '[as]'), (video, audio))
+
+    def testTimedOverlays(self):
+        engine = RenderEngine([(0, 10000)], 0, [Overlay('logo.png', 'Right-Top'), Overlay('name.png', 'Left-Bottom', 2000, 6500)])
+        graph, video, audio = engine.getFilterGraph('in.mp4')
+        self.assertIn('[v][1:v]overlay=main_w-overlay_w:0[vo0]', graph)
+        self.assertIn("[vo0][2:v]overlay=0:main_h-overlay_h:enable='between(t,2.0,6.5)'[vo]", graph)
+        self.assertEqual('[vo]', video)
+
+    def testSingleEncode(self):
+        cmd = RenderEngine([(0, 1000)]).getRenderCmd('in.mp4', 'out')
+        self.assertEqual(1, cmd.count('ffmpeg'))
+        self.assertEqual(['-map', '[v]', '-map', '[a]', '-fps_mode', 'passthrough', 'out.mp4'], cmd[-7:])
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testKeepsSourceFrameRate(self):
+        with tempfile.TemporaryDirectory() as temp:
+            source = makeVideo(os.path.join(temp, 'in.mp4'))
+            RenderEngine([(0, 1000), (2000, 1500)], profile='draft').render(source, os.path.join(temp, 'out'))
+            log = readVideo(os.path.join(temp, 'out.mp4'))
+        self.assertEqual('30', re.search(r'(\d+) tbr', log).group(1))
+        self.assertEqual(75, countFrames(log))
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testSourceWithoutAudio(self):
+        with tempfile.TemporaryDirectory() as temp:
+            source = makeVideo(os.path.join(temp, 'in.mp4'), audio=False)
+            for mode in ('single', 'parallel'):
+                RenderEngine([(0, 1000), (2000, 1500)], profile='draft').render(source, os.path.join(temp, mode), mode)
+                log = readVideo(os.path.join(temp, f'{mode}.mp4'))
+                self.assertNotIn('Audio:', log)
+                self.assertEqual(75, countFrames(log))
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testSpeedAtJoinKeepsFrames(self):
+        with tempfile.TemporaryDirectory() as temp:
+            source = makeVideo(os.path.join(temp, 'in.mp4'))
+            RenderEngine([(0, 1000), (2000, 1500)], 2, profile='draft').render(source, os.path.join(temp, 'out'), 'parallel')
+            self.assertEqual(75, countFrames(readVideo(os.path.join(temp, 'out.mp4'))))
+
+    def testMultiSourceGraph(self):
+        engine = RenderEngine([(0, 1000), (500, 1000, 'b.mp4'), (2000, 1000, 'a.mp4')], 0, [Overlay('logo.png', 'Center')])
+        graph, video, audio = engine.getFilterGraph('a.mp4')
+        self.assertIn('[1:v]trim=start=0.5:duration=1.0,setpts=PTS-STARTPTS[v1]', graph)
+        self.assertIn('[0:a]atrim=start=2.0:duration=1.0,asetpts=PTS-STARTPTS[a2]', graph)
+        self.assertIn('[v][2:v]overlay=', graph)
+        cmd = engine.getRenderCmd('a.mp4', 'out')
+        self.assertEqual(['-i', 'a.mp4', '-i', 'b.mp4', '-i', 'logo.png'], cmd[2:8])
+
+    def testSegmentThreadBudget(self):
+        engine = RenderEngine([(0, 1000)], workers=4, threads=2)
+        cmd = engine.getCutCmd(1500, 1000, 'in.mp4', '0.mp4')
+        self.assertEqual(['-y', '-ss', '1.5', '-i', 'in.mp4', '-t', '1.0', '-threads', '2', '0.mp4'], cmd[1:])
+        self.assertEqual(['-threads', '2'], engine.getRenderCmd('in.mp4', 'out')[6:8])
+        self.assertNotIn('-threads', RenderEngine([(0, 1000)]).getRenderCmd('in.mp4', 'out'))
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def testFailedJobStopsSiblings(self):
+        engine = RenderEngine([], workers=2)
+        jobs = [('segment 0', ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc', '-t', '60', '-f', 'null', '-'], '0.mp4', ('encode', 0, 60000), 'in.mp4'),
+                ('segment 1', ['videoeditor-missing-ffmpeg'], '1.mp4', ('encode', 0, 1000), 'in.mp4')]
+        started = time.monotonic()
+        with self.assertRaises(RenderError) as context:
+            engine.runJobs(jobs)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(['segment 1'], [name for name, code, log in context.exception.errors])
+        self.assertIn('FileNotFoundError', str(context.exception))
+
+    def testDraftProfile(self):
+        engine = RenderEngine([(0, 1000), (2000, 1000)], 2, profile='draft')
+        graph, video, audio = engine.getFilterGraph()
+        self.assertTrue(graph.endswith("[vs]scale=-2:'min(480,ih)'[vz]"))
+        for cmd in [engine.getRenderCmd('in.mp4', 'out')] + [job[1] for job in engine.getCutJobs('in.mp4', 'tmp')]:
+            self.assertEqual('ultrafast', cmd[cmd.index('-preset') + 1])
+
+    def testExportSplitsOneDecode(self):
+        cmd = RenderEngine([(0, 1000), (2000, 1000)]).getExportCmd('in.mp4', 'out', ['720p', '480p', 'audio'])
+        self.assertEqual(1, cmd.count('-i'))
+        graph = cmd[cmd.index('-filter_complex') + 1]
+        self.assertIn('[v]split=2[x0][x1];[a]asplit=3[y0][y1][y2]', graph)
+        self.assertIn("[x1]scale=-2:'min(480,ih)'[480p]", graph)
+        self.assertEqual(['out_720p.mp4', 'out_480p.mp4', 'out_audio.mp4'], [arg for arg in cmd if arg.startswith('out_')])
+        self.assertEqual(['-map', '[y2]'], cmd[cmd.index('-vn') - 2:cmd.index('-vn')])
+
+    def testAudioOnlyExport(self):
+        engine = RenderEngine([(0, 1000), (2000, 1000)])
+        cmd = engine.getExportCmd('in.mp4', 'out', ['audio'])
+        self.assertIn('[v]nullsink', cmd[cmd.index('-filter_complex') + 1])
+        self.assertNotIn('split=', cmd[cmd.index('-filter_complex') + 1])
+        self.assertRaises(RenderError, engine.getExportCmd, 'in.mp4', 'out', ['720p', 'audio', '720p'])
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testRenderAudioOnlyExport(self):
+        with tempfile.TemporaryDirectory() as temp:
+            source = makeVideo(os.path.join(temp, 'in.mp4'))
+            RenderEngine([(0, 1000), (2000, 1500)]).render(source, os.path.join(temp, 'out'), 'export', targets=['audio'])
+            info = subprocess.run(['ffmpeg', '-i', os.path.join(temp, 'out_audio.mp4')], capture_output=True, text=True).stderr
+        self.assertIn('Audio: aac', info)
+        self.assertNotIn('Video:', info)
+
+    def testKeyframeAlignedChunks(self):
+        engine = RenderEngine([(0, 30000)])
+        index = KeyframeIndex('in.mp4', [0, 4000, 8000, 12000, 16000, 20000, 24000, 28000])
+        self.assertEqual([(0, 12000), (12000, 12000), (24000, 6000)], engine.getChunks(0, 30000, 10000, index))
+        jobs = engine.getCutJobs('in.mp4', 'tmp', 10000, {'in.mp4': index})
+        self.assertEqual(['segment 0.0', 'segment 0.1', 'segment 0.2'], [job[0] for job in jobs])
+        self.assertEqual([(0, 30000)], engine.getChunks(0, 30000, 0))
+
+    def testStreamingOutput(self):
+        cmd = RenderEngine([(0, 1000)], container='hls').getRenderCmd('in.mp4', 'out')
+        self.assertEqual(['-f', 'hls', '-hls_time', '4'], cmd[cmd.index('-f'):cmd.index('-f') + 4])
+        self.assertEqual(['-hls_segment_filename', 'out_%05d.ts', 'out.m3u8'], cmd[-3:])
+        cmd = RenderEngine([(0, 1000)], container='fmp4').getJoinCmd(['0.mp4'], 'out')
+        self.assertNotIn('-force_key_frames', cmd)
+        self.assertEqual(['-movflags', '+frag_keyframe+empty_moov+default_base_moof', 'out.mp4'], cmd[-3:])
+
+
+class TestRenderTrace(unittest.TestCase):
+    def testStagesAndChromeEvents(self):
+        trace = RenderTrace()
+        started = trace.started
+        trace.add('segment 0', ['ffmpeg'], started, started + 2, None, (100, 50), 0)
+        trace.add('segment 1', ['ffmpeg'], started + 1, started + 2, None, (100, 50), 0)
+        trace.add('join', ['ffmpeg'], started + 2, started + 3, None, (200, 150), 0)
+        stages = trace.getStages()
+        self.assertEqual((2, 3, 200), (stages['segment']['runs'], stages['segment']['wall'], stages['segment']['readBytes']))
+        events = [event for event in trace.toChrome()['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual([0, 1e6, 2e6], [event['ts'] for event in events])
+        self.assertEqual(1e6, events[2]['dur'])
+
+
+class TestMediaProbe(unittest.TestCase):
+    def testParse(self):
+        info = MediaInfo.parse({'format': {'duration': '12.500000'}, 'streams': [
+            {'codec_type': 'video', 'codec_name': 'h264', 'width': 1920, 'height': 1080, 'avg_frame_rate': '30000/1001', 'time_base': '1/30000', 'pix_fmt': 'yuv420p'},
+            {'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '48000', 'channels': 2}]})
+        self.assertEqual(12500, info.duration)
+        self.assertAlmostEqual(29.97, info.getFps(), 2)
+        self.assertEqual(('h264', 1920, 1080, '30000/1001', '1/30000', 'yuv420p', 'aac', 48000, 2), info.getFormat())
+        self.assertEqual(info.getFormat(), MediaInfo(**info.toJson()).getFormat())
+
+
+class TestSceneAnalyzer(unittest.TestCase):
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testSourceWithoutAudioHasNoSilences(self):
+        from analysis import SceneAnalyzer
+        with tempfile.TemporaryDirectory() as temp:
+            analyzer = SceneAnalyzer(makeVideo(os.path.join(temp, 'in.mp4'), audio=False))
+            analyzer.run()
+        self.assertEqual(40, len(analyzer.scores))
+        self.assertEqual([], analyzer.getSilences())
+
+
+class TestSmartCut(unittest.TestCase):
+    def testPartsAlignedToKeyframes(self):
+        keyframes = KeyframeIndex('in.mp4', [0, 2000, 4000, 6000])
+        parts = RenderEngine([]).getSmartParts(500, 5000, keyframes)
+        self.assertEqual([(500, 1500, False), (2000, 2000, True), (4000, 1500, False)], parts)
+
+    def testShortBlockIsReencoded(self):
+        keyframes = KeyframeIndex('in.mp4', [0, 2000, 4000])
+        self.assertEqual([(2500, 1000, False)], RenderEngine([]).getSmartParts(2500, 1000, keyframes))
+
+    def testAudioMustMatchReencodedEdges(self):
+        engine = RenderEngine([(500, 5000)])
+        self.assertTrue(engine.canSmartCut('in.mp4', {'in.mp4': KeyframeIndex('in.mp4', [0, 2000], sampleRate=44100)}))
+        self.assertFalse(engine.canSmartCut('in.mp4', {'in.mp4': KeyframeIndex('in.mp4', [0, 2000], audioCodec='mp3', sampleRate=44100)}))
+        keyframes = KeyframeIndex('in.mp4', [0, 2000, 4000], sampleRate=44100)
+        self.assertEqual(['-ar', '44100'], engine.getSmartJobs('in.mp4', 'tmp', {'in.mp4': keyframes})[0][1][-3:-1])
+
+    def testCopyEndsAtKeyframeDecodeTime(self):
+        keyframes = KeyframeIndex('in.mp4', [0, 2000, 4000], decodeTimes=[-66, 1933, 3933])
+        jobs = RenderEngine([(500, 5000)]).getSmartJobs('in.mp4', 'tmp', {'in.mp4': keyframes})
+        self.assertEqual(('copy', 2000, 2000, 3933), jobs[1][3])
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testSmartRenderKeepsFrames(self):
+        with tempfile.TemporaryDirectory() as temp:
+            source = makeVideo(os.path.join(temp, 'in.mp4'), duration=12, args=['-g', '30', '-bf', '2'])
+            RenderEngine([(500, 5000), (7300, 3000)]).render(source, os.path.join(temp, 'out'), 'smart', KeyframeIndex.build(source))
+            self.assertEqual(240, countFrames(readVideo(os.path.join(temp, 'out.mp4'))))
+
+    @unittest.skipUnless(canRender, 'ffmpeg or ffprobe is not installed')
+    def testSmartRenderFromRelativeSource(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp:
+            os.chdir(temp)
+            try:
+                source = makeVideo("it's.mp4", duration=6, args=['-g', '30'])
+                RenderEngine([(500, 4000)]).render(source, 'out', 'smart', KeyframeIndex.build(source))
+                log = readVideo('out.mp4')
+            finally:
+                os.chdir(cwd)
+        self.assertAlmostEqual(4.0, float(re.search(r'Duration: 00:00:([\d.]+)', log).group(1)), delta=0.1)
+        self.assertEqual(120, countFrames(log))
+
+
+class TestSegmentCache(unittest.TestCase):
+    def testLeastRecentlyUsedIsEvicted(self):
+        with tempfile.TemporaryDirectory() as temp:
+            cache = SegmentCache(os.path.join(temp, 'cache'), maxBytes=20)
+            keys = [cache.getKey('file', ('encode', i * 1000, 1000)) for i in range(3)]
+            for i, key in enumerate(keys):
+                segment = os.path.join(temp, f'{i}.mp4')
+                with open(segment, 'wb') as f:
+                    f.write(b'0123456789')
+                cache.put(key, segment)
+                os.utime(cache.get(key), (i, i))
+            os.utime(cache.get(keys[0]))
+
+            cache.evict()
+            self.assertIsNotNone(cache.get(keys[0]))
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertIsNotNone(cache.get(keys[2]))
+
+    def testDirectoryIsCreatedOnFirstPut(self):
+        with tempfile.TemporaryDirectory() as temp:
+            cache = SegmentCache(os.path.join(temp, 'cache'))
+            cache.evict()
+            self.assertFalse(os.path.exists(cache.directory))
+            segment = os.path.join(temp, '0.mp4')
+            open(segment, 'wb').close()
+            self.assertTrue(os.path.isfile(cache.put(cache.getKey('file', ('encode', 0, 1000)), segment)))
+
+
+class TestEditDecisionList(unittest.TestCase):
+    def testLoadJson(self):
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, 'intro.json')
+            with open(path, 'w') as f:
+                f.write('{"source": "in.mp4", "segments": [[0, 2000], {"start": 5000, "duration": 1500}], '
+                        '"speed": 1.5, "image": "logo.png", "position": "Right-Bottom"}')
+            edl = EditDecisionList.load(path)
+        self.assertEqual('intro', edl.output)
+        self.assertEqual(os.path.join(temp, 'in.mp4'), edl.source)
+        self.assertEqual([(0, 2000), (5000, 1500)], edl.segments)
+        self.assertEqual((os.path.join(temp, 'logo.png'), 'Right-Bottom'), (edl.overlays[0].image, edl.overlays[0].position))
+
+    def testExistingOutputIsSkipped(self):
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, 'intro.json')
+            with open(path, 'w') as f:
+                f.write('{"source": "in.mp4", "segments": [[0, 2000]]}')
+            open(os.path.join(temp, 'intro.mp4'), 'w').close()
+            result = renderJob(path, temp, 1, None)
+        self.assertEqual('skipped', result['status'])
+        self.assertIn('--overwrite', result['error'])
+
+    def testMalformedJobIsReported(self):
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, 'intro.json')
+            with open(path, 'w') as f:
+                f.write('{"source": "in.mp4", "segments": [5]}')
+            result = renderJob(path, temp, 1, None)
+        self.assertEqual('failed', result['status'])
+        self.assertTrue(result['error'].startswith('TypeError: '))
+
+
+class TestSegmentModel(unittest.TestCase):
+    def setUp(self):
+        self.model = SegmentModel(10000)
+        self.model.replace(0, 1, [Segment(0, 3000, 0), Segment(3000, 3000, 3000), Segment(6000, 4000, 6500)])
+
+    def testFind(self):
+        self.assertEqual(1, self.model.find(3000))
+        self.assertEqual(-1, self.model.find(6200))
+        self.assertEqual(2, self.model.find(9000))
+        self.assertEqual(2, self.model.indexOf(self.model[2]))
+
+    def testRemoveAndInsertAt(self):
+        removed = self.model.removeAt([0, 2])
+        self.assertEqual([(3000, 3000)], self.model.getBlocks())
+        self.model.insertAt([0, 2], removed)
+        self.assertEqual([(0, 3000), (3000, 3000), (6000, 4000)], self.model.getBlocks())
+        self.assertEqual([0, 3000, 6500], self.model.xs)
+
+    def testBounds(self):
+        self.assertEqual((3000, 3500), self.model.getBounds(1))
+        self.assertEqual((6000, 6000), self.model.getBounds(2))
+
+    def testSplit(self):
+        segments = self.model.split([1000, 7000], [(2000, 3500), (8000, 20000)])
+        self.assertEqual([(0, 1000, 0), (1000, 1000, 1000), (3500, 2500, 3500), (6000, 1000, 6500), (7000, 1000, 7500)],
+                         [(s.start, s.duration, s.x) for s in segments])
+
+    def testSnapshot(self):
+        snapshot = Snapshot(self.model.segments)
+        snapshot.compress()
+        restored = snapshot.restore()
+        self.assertEqual([(0, 3000, 0), (3000, 3000, 3000), (6000, 4000, 6500)], [(s.start, s.duration, s.x) for s in restored])
+        self.assertIsInstance(restored[0].start, int)
+
+
+class TestEditLogic(unittest.TestCase):
+    def testCutDeleteUndo(self):
+        logic = EditLogic(10000)
+        logic.cut(4000)
+        logic.selected = {logic.model[1]}
+        logic.delete()
+        self.assertEqual([(0, 4000)], logic.model.getBlocks())
+        logic.undoStack.undo()
+        logic.undoStack.undo()
+        self.assertEqual([(0, 10000)], logic.model.getBlocks())
+        logic.undoStack.redo()
+        self.assertEqual([(0, 4000), (4000, 6000)], logic.model.getBlocks())
+
+    def testCutSnapsToFrame(self):
+        logic = EditLogic(10000)
+        logic.frameRates[''] = 30
+        logic.cut(1010)
+        self.assertEqual([(0, 1000), (1000, 9000)], logic.model.getBlocks())
+        logic.cut(1050)
+        self.assertEqual(1033, logic.model[2].start)
+        self.assertEqual(31, getFrame(logic.model[2].start, 30))
+
+    def testSnappedCutStaysInSegment(self):
+        logic = EditLogic(10000)
+        logic.frameRates[''] = 30
+        logic.autoCut([3610], [])
+        logic.cut(3615)
+        self.assertEqual([(0, 3610), (3610, 6390)], logic.model.getBlocks())
+        logic.cut(3650)
+        self.assertEqual([(0, 3610), (3610, 23), (3633, 6367)], logic.model.getBlocks())
+
+    def testMovesAreMerged(self):
+        logic = EditLogic(10000)
+        logic.cut(4000)
+        logic.selected = {logic.model[0]}
+        logic.delete()
+        logic.push(MoveAction(0, 4000, 2000, logic))
+        logic.push(MoveAction(0, 2000, 1000, logic))
+        self.assertEqual(3, logic.undoStack.count())
+        logic.push(MoveAction(0, 1000, 4000, logic))
+        self.assertEqual(2, logic.undoStack.count())
+        self.assertEqual([4000], logic.model.xs)
+
+    def testHistoryIsBounded(self):
+        logic = EditLogic(100000, maxHistoryBytes=1000)
+        for i in range(200):
+            logic.cut(100000 - (i + 1) * 400)
+            logic.selected = {logic.model[len(logic.model) - 1]}
+            logic.delete()
+        commands = [logic.undoStack.command(i) for i in range(logic.undoStack.count())]
+        self.assertLessEqual(sum(getattr(command, 'size', 0) for command in commands), 1000)
+        final = logic.model.getBlocks()
+        while logic.undoStack.canUndo():
+            logic.undoStack.undo()
+        self.assertNotEqual([(0, 100000)], logic.model.getBlocks())
+        while logic.undoStack.canRedo():
+            logic.undoStack.redo()
+        self.assertEqual(final, logic.model.getBlocks())
+
+    def testKeyframesForRenderedSources(self):
+        logic = EditLogic(10000)
+        index = logic.keyframes['a.mp4'] = KeyframeIndex('a.mp4', [0, 2000])
+        self.assertEqual({'a.mp4': index}, logic.getKeyframes('in.mp4', ['a.mp4']))
+
+    def testImportBudget(self):
+        code = ('import sys, time\n'
+                'started = time.perf_counter()\n'
+                'import edit, batch, farm\n'
+                'print(time.perf_counter() - started)\n'
+                'print(any(name.startswith(("PyQt5", "numpy")) for name in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        self.assertEqual('False', output[1])
+        self.assertLess(float(output[0]), 0.3)
+
+
+@unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+class TestRenderFarm(unittest.TestCase):
+    def testFailedChunkIsRetriedFromScratch(self):
+        with tempfile.TemporaryDirectory() as temp:
+            chunks = []
+            for i in range(4):
+                segment = os.path.join(temp, f'{i}.mp4')
+                source = 'color=size=16x16:duration=0.5' if i < 3 else os.path.join(temp, 'missing')
+                chunks.append((f'segment {i}', ['ffmpeg', '-y', '-f', 'lavfi' if i < 3 else 'mp4', '-i', source, segment], None, segment))
+            with open(chunks[3][3], 'wb') as f:
+                f.write(b'partial')
+            farm = RenderFarm(workers=3, retries=1)
+            trace = RenderTrace()
+            with self.assertRaises(RenderError) as context:
+                farm.runChunks(chunks, ProcessGroup(), trace)
+            self.assertEqual(['segment 3'], [name for name, code, log in context.exception.errors])
+            self.assertEqual(2, farm.attempts[3])
+            self.assertFalse(os.path.exists(chunks[3][3]))
+
+            farm.runChunks(chunks[:3], ProcessGroup(), trace)
+            self.assertTrue(all(os.path.getsize(chunk[3]) > 0 for chunk in chunks[:3]))
+            self.assertGreater(len({invocation['name'].split(' on ')[1] for invocation in trace.invocations}), 1)
+
+
+
+class FakePlayer(QObject):
+    positionChanged = pyqtSignal(int)
+    PlayingState = 1
+
+    def __init__(self):
+        super().__init__()
+        self.seeks = []
+
+    def setNotifyInterval(self, interval):
+        self.interval = interval
+
+    def setPosition(self, position):
+        self.seeks.append(position)
+
+    def state(self):
+        return 0
+
+
+class TestPlayheadController(unittest.TestCase):
+    def setUp(self):
+        self.app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+        self.player = FakePlayer()
+        self.controller = PlayheadController(self.player)
+        self.positions = []
+        self.controller.positionChanged.connect(self.positions.append)
+
+    def runEvents(self, ms=200):
+        loop = QEventLoop()
+        QTimer.singleShot(ms, loop.quit)
+        loop.exec_()
+
+    def testRapidSeeksAreDebounced(self):
+        for i in range(10):
+            self.controller.seek(i * 100)
+        self.runEvents()
+        self.assertEqual([900], self.player.seeks)
+        self.assertEqual([900], self.positions)
+
+    def testStepUsesFrameRate(self):
+        self.controller.setFrameRate(30)
+        self.assertEqual(33, self.player.interval)
+        self.controller.seek(900)
+        self.runEvents()
+        self.controller.step(3)
+        self.runEvents()
+        self.assertEqual([900, 1000], self.player.seeks)
+
 
 #
 # if __name__ == '__main__':
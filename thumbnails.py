@@ -0,0 +1,45 @@
+import math, os
+from cache import cacheDir, getFileId
+from render import runFfmpeg
+
+
+class ThumbnailAtlas:
+    columns = 10
+    rows = 10
+    height = 72
+    width = 128
+    keyframeLevel = 2
+    maxLevel = 12
+
+    def __init__(self, file, level):
+        self.file = file
+        self.level = level
+        self.interval = 1000 * 2 ** level
+        self.directory = os.path.join(cacheDir, 'thumbnails', getFileId(file), f'{self.width}x{self.height}_{level}')
+
+    @classmethod
+    def getLevel(cls, scale, width):
+        interval = width / scale / 1000
+        return min(cls.maxLevel, max(0, math.ceil(math.log2(max(interval, 1)))))
+
+    def isReady(self):
+        return os.path.exists(os.path.join(self.directory, 'done'))
+
+    def getCmd(self):
+        cmd = ['ffmpeg']
+        if self.level >= self.keyframeLevel:
+            cmd += ['-skip_frame', 'nokey']
+        fit = f'scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2'
+        cmd += ['-i', self.file, '-an', '-sn', '-vf', f'fps=1000/{self.interval},{fit},tile={self.columns}x{self.rows}', '-q:v', '5', os.path.join(self.directory, '%05d.jpg')]
+        return cmd
+
+    def build(self):
+        os.makedirs(self.directory, exist_ok=True)
+        runFfmpeg(self.getCmd(), 'thumbnails')
+        open(os.path.join(self.directory, 'done'), 'w').close()
+
+    def locate(self, time):
+        index = int(time // self.interval)
+        page, cell = divmod(index, self.columns * self.rows)
+        row, column = divmod(cell, self.columns)
+        return os.path.join(self.directory, f'{page + 1:05d}.jpg'), column * self.width, row * self.height
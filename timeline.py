@@ -1,17 +1,19 @@
-from PyQt5.QtWidgets import QGraphicsScene, QGraphicsItem, QGraphicsRectItem, QDesktopWidget, QUndoStack, QUndoCommand
-from PyQt5.QtGui import QBrush, QPen, QColor, QCursor, QTransform
-from PyQt5.QtCore import Qt, QRectF, QPointF
-import os, tempfile
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGraphicsItem, QGraphicsObject, QGraphicsRectItem, QGraphicsLineItem, QDesktopWidget, QScrollBar, QUndoStack, QUndoCommand
+from PyQt5.QtGui import QBrush, QPen, QColor, QCursor, QPixmap
+from PyQt5.QtCore import Qt, QRectF, QPointF, pyqtSignal
+from collections import OrderedDict
+import bisect, math, threading
+from edit import EditLogic, MoveAction, UndoCommand
+from thumbnails import ThumbnailAtlas
+from waveform import WaveformPyramid
+import numpy as np
+from render import RenderError
 
 class TimelineBlock(QGraphicsRectItem):
-    def __init__(self, rect, start, duration, scene, blocks, durationVideo, stack):
-        super().__init__(rect)
-        self.start = start
-        self.duration = duration
-        self.durationVideo = durationVideo
-        self.scene = scene
-        self.blocks = blocks
-        self.stack = stack
+    def __init__(self, segment, logic):
+        super().__init__()
+        self.segment = segment
+        self.logic = logic
         self.brush = QBrush(Qt.cyan)
         self.brush.setColor(QColor(0, 100, 255, 95))
         self.pen = QPen(self.brush, 0)
@@ -21,24 +23,33 @@ class TimelineBlock(QGraphicsRectItem):
     def draw(self):
         self.setPen(self.pen)
         self.setBrush(self.brush)
-        self.scene.addItem(self)
+        self.logic.scene.addItem(self)
+
+    def place(self):
+        width = self.segment.duration * self.logic.scale
+        self.setRect(QRectF(1, 0, max(width - 2, 1), self.logic.blockHeight))
+        self.setPos(self.logic.toPixels(self.segment.x), 0)
+
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.ItemSelectedHasChanged:
+            if value:
+                self.logic.selected.add(self.segment)
+            else:
+                self.logic.selected.discard(self.segment)
+        return super().itemChange(change, value)
 
     def mouseMoveEvent(self, event):
         self.setSelected(False)
-        x = event.scenePos().x() - self.mousePressCoord.x() + self.itemPressCoord.x()
-        if x + self.rect().width() >= self.scene.width():
-            x = self.scene.width() - self.rect().width()
-        if x <= 0:
-            x = 0
+        scale = self.logic.scale
+        x = self.logic.toTime(event.scenePos().x() - self.mousePressCoord.x() + self.itemPressCoord.x())
 
-        index = self.blocks.index(self)
-        if index < len(self.blocks) - 1 and x + self.rect().width() + 15 >= self.blocks[index + 1].scenePos().x():
-            x = self.blocks[index + 1].scenePos().x() - self.rect().width() - 2
-        if index > 0 and x - 15 <= self.blocks[index - 1].scenePos().x() + self.blocks[index - 1].rect().width():
-            x = self.blocks[index - 1].scenePos().x() + self.blocks[index - 1].rect().width() + 2
+        low, high = self.logic.model.getBounds(self.logic.model.indexOf(self.segment))
+        if x + 15 / scale >= high:
+            x = high
+        if x - 15 / scale <= low:
+            x = low
 
-        position = QPointF(x, self.pos().y())
-        self.setPos(position)
+        self.setPos(self.logic.toPixels(x), self.pos().y())
 
     def mousePressEvent(self, event):
         self.mousePressCoord = event.scenePos()
@@ -54,176 +65,353 @@ class TimelineBlock(QGraphicsRectItem):
         self.setCursor(QCursor(Qt.ArrowCursor))
         self.setOpacity(1)
         if event.scenePos() != self.mousePressCoord:
-            command = MoveAction(self.itemPressCoord, self.scenePos(), self)
-            self.stack.push(command)
+            index = self.logic.model.indexOf(self.segment)
+            command = MoveAction(index, self.segment.x, self.logic.toTime(self.pos().x()), self.logic)
+            self.logic.push(command)
 
 
-class TimelineLogic:
-    def __init__(self, duration=0):
-        screenSize = QDesktopWidget().availableGeometry()
-        self.width = screenSize.width() - 30
-        self.height = screenSize.height() // 8 - 10
-        self.durationVideo = duration
-        self.speed = 0
-        self.imageToAdd = ('', '')
+class AggregateBlock(QGraphicsRectItem):
+    def __init__(self, logic):
+        super().__init__()
+        brush = QBrush(QColor(0, 100, 255, 140))
+        self.setBrush(brush)
+        self.setPen(QPen(brush, 0))
+        self.logic = logic
 
-        self.scene = QGraphicsScene(0, 0, self.width, self.height)
-        self.timeLineBlocks = []
-        self.undoStack = QUndoStack()
-
-        block = TimelineBlock(QRectF(0, 0, self.width, self.height), 0, duration, self.scene, self.timeLineBlocks, duration, self.undoStack)
-        block.setPos(0, 0)
-        self.timeLineBlocks.append(block)
-        block.draw()
-
-    def cut(self, position):
-        x = position * self.width / self.durationVideo
-        item = self.scene.itemAt(x, 10, QTransform())
-        if not item or x == 0:
+    def place(self, x1, x2):
+        self.setRect(QRectF(0, 0, max((x2 - x1) * self.logic.scale, 1), self.logic.blockHeight))
+        self.setPos(self.logic.toPixels(x1), 0)
+
+    def mouseDoubleClickEvent(self, event):
+        self.logic.zoom(4, event.scenePos().x())
+
+
+class FilmstripItem(QGraphicsObject):
+    ready = pyqtSignal()
+    maxPages = 16
+
+    def __init__(self, logic):
+        super().__init__()
+        self.logic = logic
+        self.file = ''
+        self.atlases = {}
+        self.building = set()
+        self.pages = OrderedDict()
+        self.setZValue(-1)
+        self.ready.connect(self.update)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.logic.width, self.logic.blockHeight)
+
+    def setSource(self, file):
+        self.file = file
+        self.atlases = {}
+        self.pages = OrderedDict()
+        self.update()
+
+    def getAtlas(self):
+        width = ThumbnailAtlas.width * self.logic.blockHeight / ThumbnailAtlas.height
+        level = ThumbnailAtlas.getLevel(self.logic.scale, width)
+        if level not in self.atlases:
+            self.atlases[level] = ThumbnailAtlas(self.file, level)
+        atlas = self.atlases[level]
+        if atlas.isReady():
+            return atlas
+
+        if level not in self.building:
+            self.building.add(level)
+            threading.Thread(target=self.build, args=(atlas,), daemon=True).start()
+        ready = [other for other in self.atlases.values() if other.isReady()]
+        return min(ready, key=lambda other: abs(other.level - level), default=None)
+
+    def build(self, atlas):
+        try:
+            atlas.build()
+        except (RenderError, OSError):
+            pass
+        self.ready.emit()
+
+    def getPage(self, path):
+        if path in self.pages:
+            self.pages.move_to_end(path)
+            return self.pages[path]
+        page = QPixmap(path)
+        self.pages[path] = page
+        if len(self.pages) > self.maxPages:
+            self.pages.popitem(last=False)
+        return page
+
+    def paint(self, painter, option, widget=None):
+        if self.file == '':
             return
-        index = self.timeLineBlocks.index(item)
-
-        command = CutAction(position, index, self)
-        self.undoStack.push(command)
-
-    def delete(self):
-        blocksToDel = []
-        for block in self.timeLineBlocks:
-            if block.isSelected():
-                blocksToDel.append(block)
-
-        indexes = [self.timeLineBlocks.index(block) for block in blocksToDel]
-
-        command = DeleteAction(blocksToDel, indexes, self)
-        self.undoStack.push(command)
-
-    def render(self, file, output):
-        with tempfile.TemporaryDirectory() as temp:
-            i = 0
-            for block in self.timeLineBlocks:
-                cmd = self.getCutCmd(block.start / 1000, block.duration / 1000, file, i, temp)
-                os.system(cmd)
-                i += 1
-            with open(os.path.join(temp, 'files.txt'), 'w') as files:
-                files.writelines('\n'.join([f"file '{os.path.join(temp, str(file))}.mp4'" for file in range(i)]))
-
-            if self.speed != 0:
-                cuted = os.path.join(temp, str(i))
-                os.system(f'ffmpeg -f concat -safe 0 -i {files.name} -c copy {cuted}.mp4')
-                if self.imageToAdd != ('', ''):
-                    out = os.path.join(temp, str(i + 1))
-                else:
-                    out = output
-                os.system(f'ffmpeg -i {cuted}.mp4 -filter_complex "[0:v]setpts={1 / self.speed}*PTS[v];[0:a]atempo={self.speed}[a]" -map "[v]" -map "[a]" {out}.mp4')
-                i += 1
-
-            if self.imageToAdd != ('', ''):
-                image, textPos = self.imageToAdd
-                textToCmd = {
-                    'Left-Top': self.getCmdPos('0', '0'),
-                    'Top': self.getCmdPos('w/2', '0'),
-                    'Right-Top': self.getCmdPos('w', '0'),
-                    'Left': self.getCmdPos('0', 'h/2'),
-                    'Center': self.getCmdPos('w/2', 'h/2'),
-                    'Right': self.getCmdPos('w', 'h/2'),
-                    'Left-Bottom': self.getCmdPos('0', 'h'),
-                    'Bottom': self.getCmdPos('w/2', 'h'),
-                    'Right-Bottom': self.getCmdPos('w', 'h')
-                }
-                pos = textToCmd[textPos]
-
-                speeded = os.path.join(temp, str(i))
-                if self.speed == 0:
-                    os.system(f'ffmpeg -f concat -safe 0 -i {files.name} -c copy {speeded}.mp4')
-                os.system(f'ffmpeg -i {speeded}.mp4 -i {image} -filter_complex "[0:v][1:v]overlay={pos}" {output}.mp4')
-
-            if self.speed == 0 and self.imageToAdd == ('', ''):
-                os.system(f'ffmpeg -f concat -safe 0 -i {files.name} -c copy {output}.mp4')
-
-    def getCutCmd(self, start, duration, file, result, dir):
-        return f'ffmpeg -ss {start} -i {file} -t {duration} {os.path.join(dir, str(result))}.mp4'
-
-    def getCmdPos(self, width, height):
-        x = '0'
-        y = '0'
-        if width != '0':
-            x = f'main_{width}-overlay_{width}'
-        if height != '0':
-            y = f'main_{height}-overlay_{height}'
-        return x + ':' + y
-
-
-class CutAction(QUndoCommand):
-    def __init__(self, position, index, logic):
-        super().__init__('Cut')
-        self.position = position
-        self.index = index
+        atlas = self.getAtlas()
+        if atlas is None:
+            return
+
+        width = ThumbnailAtlas.width * self.logic.blockHeight / ThumbnailAtlas.height
+        for segment in self.logic.items:
+            if segment.source != '':
+                continue
+            x1 = max(self.logic.toPixels(segment.x), 0)
+            x2 = min(self.logic.toPixels(segment.end()), self.logic.width)
+            painter.setClipRect(QRectF(x1, 0, x2 - x1, self.logic.blockHeight))
+            time = segment.start + self.logic.toTime(x1) - segment.x
+            time = math.floor(time / atlas.interval) * atlas.interval
+            while time < segment.start + segment.duration and self.logic.toPixels(segment.x + time - segment.start) < x2:
+                path, column, row = atlas.locate(time)
+                page = self.getPage(path)
+                if not page.isNull():
+                    target = QRectF(self.logic.toPixels(segment.x + time - segment.start), 0, width, self.logic.blockHeight)
+                    painter.drawPixmap(target, page, QRectF(column, row, ThumbnailAtlas.width, ThumbnailAtlas.height))
+                time += atlas.interval
+        painter.setClipping(False)
+
+
+class WaveformItem(QGraphicsObject):
+    ready = pyqtSignal()
+
+    def __init__(self, logic):
+        super().__init__()
+        self.logic = logic
+        self.waveform = None
+        self.pen = QPen(QColor(20, 160, 90), 0)
+        self.ready.connect(self.update)
+
+    def boundingRect(self):
+        return QRectF(0, self.logic.blockHeight, self.logic.width, self.logic.height - self.logic.blockHeight)
+
+    def setSource(self, file):
+        self.waveform = None
+        if file != '':
+            threading.Thread(target=self.build, args=(WaveformPyramid(file),), daemon=True).start()
+        self.update()
+
+    def build(self, waveform):
+        try:
+            if not waveform.load():
+                waveform.build()
+        except (RenderError, OSError):
+            return
+        self.waveform = waveform
+        self.ready.emit()
+
+    def paint(self, painter, option, widget=None):
+        waveform = self.waveform
+        if waveform is None:
+            return
+
+        top = self.logic.blockHeight
+        middle = (top + self.logic.height) / 2
+        amplitude = (self.logic.height - top) / 2
+        level = waveform.getLevel(self.logic.scale)
+        painter.setPen(self.pen)
+        for segment in self.logic.items:
+            if segment.source != '':
+                continue
+            x1 = max(int(self.logic.toPixels(segment.x)), 0)
+            x2 = min(int(self.logic.toPixels(segment.end())), self.logic.width)
+            if x2 <= x1:
+                continue
+            pixels = np.arange(x1, x2 + 1)
+            times = segment.start + self.logic.offset + pixels / self.logic.scale - segment.x
+            low, high = waveform.getPeaks(times, level)
+            for x, y1, y2 in zip(pixels, middle - high * amplitude, middle - low * amplitude):
+                painter.drawLine(QPointF(x, y1), QPointF(x, y2))
+
+
+class TimelineView(QGraphicsView):
+    def __init__(self):
+        super().__init__()
+        self.logic = None
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.scrollBar = QScrollBar(Qt.Horizontal)
+        self.scrollBar.valueChanged.connect(self.scrolled)
+
+    def setLogic(self, logic):
         self.logic = logic
+        self.setScene(logic.scene)
+        logic.view = self
+        self.updateScrollBar()
+
+    def updateScrollBar(self):
+        visible = int(self.logic.getVisibleDuration())
+        self.scrollBar.blockSignals(True)
+        self.scrollBar.setRange(0, max(0, int(self.logic.durationVideo) - visible))
+        self.scrollBar.setPageStep(max(1, visible))
+        self.scrollBar.setSingleStep(max(1, visible // 20))
+        self.scrollBar.setValue(int(self.logic.offset))
+        self.scrollBar.blockSignals(False)
+
+    def scrolled(self, value):
+        if self.logic is not None:
+            self.logic.scrollTo(value)
+
+    def wheelEvent(self, event):
+        if self.logic is None:
+            return
+        delta = event.angleDelta()
+        if delta.x() != 0 or event.modifiers() & Qt.ShiftModifier:
+            step = delta.x() or delta.y()
+            self.logic.scrollTo(self.logic.offset - step / 120 * self.logic.getVisibleDuration() / 10)
+        elif delta.y() != 0:
+            self.logic.zoom(1.25 ** (delta.y() / 120), self.mapToScene(event.pos()).x())
+        event.accept()
 
-    def undo(self):
-        blockLeft = self.logic.timeLineBlocks[self.index]
-        blockRight = self.logic.timeLineBlocks[self.index + 1]
-        rect = QRectF(0, 0, blockLeft.rect().width() + blockRight.rect().width() + 2, blockLeft.rect().height())
 
-        block = TimelineBlock(rect, blockLeft.start, blockLeft.duration + blockRight.duration, self.logic.scene, self.logic.timeLineBlocks, self.logic.durationVideo, self.logic.undoStack)
-        block.setPos(blockLeft.scenePos())
+class UndoCommandAdapter(QUndoCommand):
+    def __init__(self, command):
+        super().__init__(command.text())
+        self.command = command
 
-        self.logic.timeLineBlocks.pop(self.index)
-        self.logic.timeLineBlocks.pop(self.index)
-        self.logic.timeLineBlocks.insert(self.index, block)
+    @property
+    def size(self):
+        return getattr(self.command, 'size', 0)
 
-        self.logic.scene.removeItem(blockLeft)
-        self.logic.scene.removeItem(blockRight)
-        block.draw()
+    def compress(self):
+        if hasattr(self.command, 'compress'):
+            self.command.compress()
 
-    def redo(self):
-        x = self.position * self.logic.width / self.logic.durationVideo
-        item = self.logic.timeLineBlocks[self.index]
-
-        self.logic.timeLineBlocks.pop(self.index)
-
-        rectLeft = QRectF(0, 0, x - item.scenePos().x() - 1, self.logic.height)
-        rectRight = QRectF(0, 0, item.rect().width() - rectLeft.width() - 2, self.logic.height)
-        blockLeft = TimelineBlock(rectLeft, item.start, self.position - item.start, self.logic.scene, self.logic.timeLineBlocks, self.logic.durationVideo, self.logic.undoStack)
-        blockLeft.setPos(item.scenePos().x(), 0)
-        blockRight = TimelineBlock(rectRight, self.position + 1, item.start + item.duration - self.position, self.logic.scene, self.logic.timeLineBlocks, self.logic.durationVideo, self.logic.undoStack)
-        blockRight.setPos(x + 1, 0)
-
-        self.logic.timeLineBlocks.insert(self.index, blockLeft)
-        self.logic.timeLineBlocks.insert(self.index + 1, blockRight)
-        self.logic.scene.removeItem(item)
-        blockLeft.draw()
-        blockRight.draw()
-
-
-class DeleteAction(QUndoCommand):
-    def __init__(self, blocks, indexes, logic):
-        super().__init__('Delete')
-        self.blocks = blocks
-        self.indexes = indexes
-        self.logic = logic
+    def fold(self):
+        self.command = UndoCommand(self.command.text())
+
+    def id(self):
+        return self.command.id()
+
+    def mergeWith(self, other):
+        if not isinstance(other, UndoCommandAdapter) or not self.command.mergeWith(other.command):
+            return False
+        self.setObsolete(self.command.isObsolete())
+        return True
 
     def undo(self):
-        for block in self.blocks:
-            self.logic.timeLineBlocks.insert(self.indexes[self.blocks.index(block)], block)
-            block.draw()
+        self.command.undo()
 
     def redo(self):
-        blocksToDel = [self.logic.timeLineBlocks[index] for index in self.indexes]
-        for block in blocksToDel:
-            self.logic.timeLineBlocks.remove(block)
-            self.logic.scene.removeItem(block)
+        self.command.redo()
 
 
-class MoveAction(QUndoCommand):
-    def __init__(self, before, after, block):
-        super().__init__('Move')
-        self.before = before
-        self.after = after
-        self.block = block
+class TimelineLogic(EditLogic):
+    minItemWidth = 3
+    maxScale = 1
 
-    def undo(self):
-        self.block.setPos(self.before)
+    def __init__(self, duration=0, undoLimit=None, maxHistoryBytes=None):
+        super().__init__(duration, undoLimit, maxHistoryBytes)
+        screenSize = QDesktopWidget().availableGeometry()
+        self.width = screenSize.width() - 30
+        self.height = screenSize.height() // 8 - 10
+        self.blockHeight = self.height * 3 // 4
+        self.minScale = self.width / max(duration, 1)
+        self.scale = self.minScale
+        self.offset = 0
+        self.position = 0
+        self.view = None
 
-    def redo(self):
-        self.block.setPos(self.after)
+        self.scene = QGraphicsScene(0, 0, self.width, self.height)
+        self.items = {}
+        self.aggregates = []
+
+        self.playhead = QGraphicsLineItem(0, 0, 0, self.height)
+        self.playhead.setPen(QPen(QColor(255, 60, 0), 0))
+        self.playhead.setZValue(1)
+        self.scene.addItem(self.playhead)
+        self.filmstrip = FilmstripItem(self)
+        self.scene.addItem(self.filmstrip)
+        self.waveform = WaveformItem(self)
+        self.scene.addItem(self.waveform)
+        self.refresh()
+
+    def createUndoStack(self):
+        return QUndoStack()
+
+    def push(self, command):
+        if not isinstance(command, QUndoCommand):
+            command = UndoCommandAdapter(command)
+        super().push(command)
+
+    def foldHistory(self, count):
+        for i in range(count):
+            command = self.undoStack.command(i)
+            if isinstance(command, UndoCommandAdapter):
+                command.fold()
+
+    def toPixels(self, x):
+        return (x - self.offset) * self.scale
+
+    def toTime(self, pixels):
+        return self.offset + pixels / self.scale
+
+    def getVisibleDuration(self):
+        return self.width / self.scale
+
+    def zoom(self, factor, pixels):
+        position = self.toTime(pixels)
+        self.scale = min(self.maxScale, max(self.minScale, self.scale * factor))
+        self.scrollTo(position - pixels / self.scale)
+
+    def setDuration(self, duration):
+        super().setDuration(duration)
+        self.minScale = self.width / max(duration, 1)
+        self.scale = max(self.scale, self.minScale)
+        self.scrollTo(self.offset)
+
+    def scrollTo(self, offset):
+        self.offset = min(max(0, offset), max(0, self.durationVideo - self.getVisibleDuration()))
+        self.refresh()
+        if self.view is not None:
+            self.view.updateScrollBar()
+
+    def setSource(self, file):
+        self.filmstrip.setSource(file)
+        self.waveform.setSource(file)
+
+    def setPlayhead(self, position):
+        self.position = position
+        self.playhead.setPos(self.toPixels(position), 0)
+
+    def refresh(self):
+        visible = {}
+        aggregates = []
+        end = self.toTime(self.width)
+        index, last = self.model.getRange(self.offset, end)
+        while index < last:
+            segment = self.model[index]
+            if segment.duration * self.scale >= self.minItemWidth:
+                visible[segment] = self.items.pop(segment, None)
+                index += 1
+                continue
+            bucket = min(max(index + 1, bisect.bisect_left(self.model.xs, segment.x + self.minItemWidth / self.scale)), last)
+            following = index + 1
+            while following < bucket and self.model[following].duration * self.scale < self.minItemWidth:
+                following += 1
+            aggregates.append((segment.x, self.model[following - 1].end()))
+            index = following
+
+        for segment, item in self.items.items():
+            self.hideItem(item)
+        for item in self.aggregates[len(aggregates):]:
+            self.scene.removeItem(item)
+        self.aggregates = self.aggregates[:len(aggregates)]
+        while len(self.aggregates) < len(aggregates):
+            self.aggregates.append(AggregateBlock(self))
+            self.scene.addItem(self.aggregates[-1])
+        for item, (x1, x2) in zip(self.aggregates, aggregates):
+            item.place(x1, x2)
+
+        self.items = {}
+        for segment, item in visible.items():
+            if item is None:
+                item = TimelineBlock(segment, self)
+                item.draw()
+                item.setSelected(segment in self.selected)
+            item.place()
+            self.items[segment] = item
+        self.setPlayhead(self.position)
+        self.filmstrip.update()
+        self.waveform.update()
+
+    def hideItem(self, item):
+        selected = item.segment in self.selected
+        self.scene.removeItem(item)
+        if selected:
+            self.selected.add(item.segment)
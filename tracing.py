@@ -0,0 +1,117 @@
+import json, os, threading, time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def readIo(pid):
+    values = {}
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                values[key] = int(value)
+    except (OSError, ValueError):
+        return None
+    return values.get('rchar', 0), values.get('wchar', 0)
+
+
+def waitProcess(process):
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None, None
+    os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    io = readIo(process.pid)
+    try:
+        pid, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return None, io
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if io is None:
+        io = (usage.ru_inblock * 512, usage.ru_oublock * 512)
+    return usage, io
+
+
+def getChildTimes():
+    if resource is None:
+        return 0, 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime, usage.ru_stime
+
+
+class RenderTrace:
+    def __init__(self):
+        self.invocations = []
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.childTimes = getChildTimes()
+        self.wall = 0
+        self.user = 0
+        self.system = 0
+
+    def add(self, name, cmd, started, finished, usage, io, returncode):
+        with self.lock:
+            lane = self.lanes.setdefault(threading.get_ident(), len(self.lanes))
+            self.invocations.append({
+                'name': name,
+                'stage': name.split()[0],
+                'cmd': cmd,
+                'lane': lane,
+                'start': started - self.started,
+                'wall': finished - started,
+                'user': usage.ru_utime if usage else 0,
+                'system': usage.ru_stime if usage else 0,
+                'readBytes': io[0] if io else 0,
+                'writeBytes': io[1] if io else 0,
+                'returncode': returncode
+            })
+
+    def finish(self):
+        user, system = getChildTimes()
+        self.wall = time.perf_counter() - self.started
+        self.user = user - self.childTimes[0]
+        self.system = system - self.childTimes[1]
+
+    def getStages(self):
+        stages = {}
+        for invocation in self.invocations:
+            stage = stages.setdefault(invocation['stage'], {'runs': 0, 'wall': 0, 'user': 0, 'system': 0, 'readBytes': 0, 'writeBytes': 0})
+            stage['runs'] += 1
+            for key in ('wall', 'user', 'system', 'readBytes', 'writeBytes'):
+                stage[key] += invocation[key]
+        return stages
+
+    def toJson(self):
+        return {'wall': self.wall, 'user': self.user, 'system': self.system, 'stages': self.getStages(), 'invocations': self.invocations}
+
+    def toChrome(self):
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'render'}}]
+        for invocation in self.invocations:
+            events.append({
+                'name': invocation['name'],
+                'cat': invocation['stage'],
+                'ph': 'X',
+                'ts': invocation['start'] * 1e6,
+                'dur': invocation['wall'] * 1e6,
+                'pid': os.getpid(),
+                'tid': invocation['lane'],
+                'args': {key: invocation[key] for key in ('cmd', 'user', 'system', 'readBytes', 'writeBytes', 'returncode')}
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path, chrome=False):
+        with open(path, 'w') as f:
+            json.dump(self.toChrome() if chrome else self.toJson(), f, indent=None if chrome else 2)
+
+    def getSummary(self):
+        lines = []
+        for stage, values in self.getStages().items():
+            lines.append(f"{stage}: {values['runs']} run(s), {values['wall']:.1f}s wall, "
+                         f"{values['user'] + values['system']:.1f}s CPU, "
+                         f"{values['readBytes'] / 2 ** 20:.1f} MiB read, {values['writeBytes'] / 2 ** 20:.1f} MiB written")
+        lines.append(f'total: {self.wall:.1f}s wall, {self.user:.1f}s user, {self.system:.1f}s system CPU')
+        return '\n'.join(lines)
@@ -0,0 +1,90 @@
+import os, subprocess
+import numpy as np
+from cache import cacheDir, getFileId
+from render import RenderError
+
+
+class WaveformPyramid:
+    sampleRate = 8000
+    chunkSamples = 1 << 16
+    bucketSizes = (32, 128, 512, 2048, 8192)
+
+    def __init__(self, file):
+        self.file = file
+        self.path = os.path.join(cacheDir, 'waveforms', f'{getFileId(file)}.npz')
+        self.mins = []
+        self.maxs = []
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            self.mins = [data[f'min{i}'] for i in range(len(self.bucketSizes))]
+            self.maxs = [data[f'max{i}'] for i in range(len(self.bucketSizes))]
+        return True
+
+    def getCmd(self):
+        return ['ffmpeg', '-v', 'error', '-i', self.file, '-vn', '-ac', '1', '-ar', str(self.sampleRate), '-f', 's16le', 'pipe:1']
+
+    def build(self):
+        bucket = self.bucketSizes[0]
+        mins, maxs = [], []
+        rest = np.empty(0, np.int16)
+        process = subprocess.Popen(self.getCmd(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        while True:
+            data = process.stdout.read(self.chunkSamples * 2)
+            if not data:
+                break
+            samples = np.concatenate((rest, np.frombuffer(data[:len(data) // 2 * 2], np.int16)))
+            full = len(samples) // bucket * bucket
+            buckets = samples[:full].reshape(-1, bucket)
+            mins.append(buckets.min(axis=1))
+            maxs.append(buckets.max(axis=1))
+            rest = samples[full:]
+        error = process.stderr.read().decode(errors='replace')
+        if process.wait() != 0:
+            raise RenderError([('waveform', process.returncode, error)])
+        if len(rest):
+            mins.append(rest.min(keepdims=True))
+            maxs.append(rest.max(keepdims=True))
+
+        self.mins = [np.concatenate(mins) if mins else np.zeros(0, np.int16)]
+        self.maxs = [np.concatenate(maxs) if maxs else np.zeros(0, np.int16)]
+        for previous, size in zip(self.bucketSizes, self.bucketSizes[1:]):
+            self.mins.append(self.reduce(self.mins[-1], size // previous, np.minimum))
+            self.maxs.append(self.reduce(self.maxs[-1], size // previous, np.maximum))
+        self.save()
+
+    def reduce(self, values, factor, function):
+        if len(values) == 0:
+            return values
+        return function.reduceat(values, np.arange(0, len(values), factor))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        arrays = {}
+        for i in range(len(self.bucketSizes)):
+            arrays[f'min{i}'] = self.mins[i]
+            arrays[f'max{i}'] = self.maxs[i]
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp, self.path)
+
+    def getLevel(self, scale):
+        samplesPerPixel = self.sampleRate / 1000 / scale
+        level = 0
+        for i, size in enumerate(self.bucketSizes):
+            if size <= samplesPerPixel:
+                level = i
+        return level
+
+    def getPeaks(self, times, level):
+        size = self.bucketSizes[level]
+        mins, maxs = self.mins[level], self.maxs[level]
+        if len(mins) == 0:
+            return np.zeros(len(times) - 1), np.zeros(len(times) - 1)
+        indexes = np.clip((np.asarray(times) * self.sampleRate / 1000 / size).astype(np.int64), 0, len(mins) - 1)
+        low = np.minimum.reduceat(mins, indexes)[:-1]
+        high = np.maximum.reduceat(maxs, indexes)[:-1]
+        return low / 32768, high / 32768
@@ -1,14 +1,64 @@
-from PyQt5.QtMultimedia import QMediaPlayer
-from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtWidgets import*
-from PyQt5.QtCore import Qt
-from timeline import TimelineLogic
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt, QEvent, QTimer, QThread, QUrl, pyqtSignal
+from timeline import TimelineLogic, TimelineView
+from render import RenderError, positions
+from proxy import Proxy
+from probe import probe
+from playhead import PlayheadController
+from frames import FrameCache
+
+
+class ProxyThread(QThread):
+    ready = pyqtSignal(str, str)
+
+    def __init__(self, proxy):
+        super().__init__()
+        self.proxy = proxy
+
+    def run(self):
+        try:
+            self.proxy.build()
+        except (RenderError, OSError):
+            return
+        self.ready.emit(self.proxy.file, self.proxy.path)
+
+
+class AnalysisThread(QThread):
+    ready = pyqtSignal(str, list, list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, analyzer):
+        super().__init__()
+        self.analyzer = analyzer
+
+    def run(self):
+        try:
+            self.analyzer.run()
+        except (RenderError, OSError) as e:
+            self.failed.emit(str(e))
+            return
+        if not self.analyzer.stopped:
+            self.ready.emit(self.analyzer.file, self.analyzer.getCuts(), self.analyzer.getSilences())
+
 
 class WorkSpace(QMainWindow):
+    analyzed = pyqtSignal(str)
+    frameCacheBytes = FrameCache.maxBytes
+
     def __init__(self):
         super().__init__()
         self.widget = QWidget(self)
         self.positionVideo = 0
+        self.source = ''
+        self.preview = False
+        self.jumpTarget = None
+        self.switchingMedia = False
+        self.resume = (0, False)
+        self.proxyThreads = []
+        self.analysisThread = None
+        self.frameCache = None
+        self.frameRate = 0
 
         self.createVideo()
         self.createPlayButton()
@@ -17,15 +67,50 @@ class WorkSpace(QMainWindow):
         self.createLayout()
 
     def createVideo(self):
-        self.mediaPlayer = QMediaPlayer(None, QMediaPlayer.VideoSurface)
+        self.mediaPlayer = None
+        self.videoWidget = None
+        self.playhead = None
+        self.videoLayout = QVBoxLayout()
+        self.videoLayout.setContentsMargins(0, 0, 0, 0)
+        self.videoFrame = QWidget()
+        self.videoFrame.setLayout(self.videoLayout)
+        self.videoFrame.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        self.jumpTimer = QTimer()
+        self.jumpTimer.setSingleShot(True)
+        self.jumpTimer.setTimerType(Qt.PreciseTimer)
+        self.jumpTimer.timeout.connect(self.jump)
+
+        self.overlayLabels = []
+        self.overlayState = None
 
-        self.mediaPlayer.setNotifyInterval(10)
+    def createPlayer(self):
+        from PyQt5.QtMultimedia import QMediaPlayer
+        from PyQt5.QtMultimediaWidgets import QVideoWidget
+        self.mediaPlayer = QMediaPlayer(None, QMediaPlayer.VideoSurface)
+        self.playhead = PlayheadController(self.mediaPlayer)
         self.videoWidget = QVideoWidget()
 
         self.mediaPlayer.setVideoOutput(self.videoWidget)
         self.mediaPlayer.stateChanged.connect(self.mediaStateChanged)
-        self.mediaPlayer.positionChanged.connect(self.positionChanged)
+        self.playhead.positionChanged.connect(self.positionChanged)
+        self.playhead.settled.connect(lambda position: self.hideTimer.start(int(self.playhead.interval)))
+        self.frameLabel = QLabel(self.videoWidget)
+        self.frameLabel.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.frameLabel.hide()
+        self.hideTimer = QTimer()
+        self.hideTimer.setSingleShot(True)
+        self.hideTimer.timeout.connect(self.frameLabel.hide)
         self.mediaPlayer.durationChanged.connect(self.durationChanged)
+        self.videoWidget.installEventFilter(self)
+        self.videoLayout.addWidget(self.videoWidget)
+
+    def setMedia(self, path):
+        from PyQt5.QtMultimedia import QMediaContent
+        self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+
+    def isPlaying(self):
+        return self.mediaPlayer is not None and self.mediaPlayer.state() == self.mediaPlayer.PlayingState
 
     def createPlayButton(self):
         self.playButton = QPushButton()
@@ -44,7 +129,7 @@ class WorkSpace(QMainWindow):
         self.timelineSlider.sliderMoved.connect(self.setPosition)
 
     def createLayout(self):
-        self.timelineWidget = QGraphicsView()
+        self.timelineWidget = TimelineView()
         screenSize = QDesktopWidget().availableGeometry()
         self.timelineWidget.setFixedSize(screenSize.width() - 20, screenSize.height() // 8)
 
@@ -61,7 +146,7 @@ class WorkSpace(QMainWindow):
         sliderBox.addWidget(self.positionSlider)
 
         videoBox = QVBoxLayout()
-        videoBox.addWidget(self.videoWidget)
+        videoBox.addWidget(self.videoFrame)
         videoBox.addLayout(sliderBox)
         video = QWidget()
         video.setLayout(videoBox)
@@ -75,34 +160,266 @@ class WorkSpace(QMainWindow):
         vbox.addWidget(splitter)
         vbox.addWidget(self.timelineSlider)
         vbox.addWidget(self.timelineWidget)
+        vbox.addWidget(self.timelineWidget.scrollBar)
 
         self.widget.setLayout(vbox)
 
     def play(self):
-        if self.mediaPlayer.state() == QMediaPlayer.PlayingState:
+        if self.mediaPlayer is None:
+            return
+        if self.isPlaying():
             self.mediaPlayer.pause()
         else:
             self.mediaPlayer.play()
 
     def mediaStateChanged(self):
-        if self.mediaPlayer.state() == QMediaPlayer.PlayingState:
+        if self.isPlaying():
             self.playButton.setIcon(self.style().standardIcon(QStyle.SP_MediaPause))
+            self.frameLabel.hide()
         else:
             self.playButton.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
+            self.jumpTimer.stop()
 
     def positionChanged(self, position):
         self.positionVideo = position
+        if self.frameCache is not None and not self.isPlaying():
+            self.frameCache.setPosition(position)
         self.positionSlider.setValue(position)
         self.timelineSlider.setValue(position)
+        if hasattr(self, 'timelineLogic'):
+            self.timelineLogic.setPlayhead(position)
+            if self.preview:
+                self.previewPosition(position)
+                self.updateOverlay()
+
+    def setPreview(self, enabled):
+        self.preview = enabled
+        self.updatePreview()
+
+    def updatePreview(self):
+        if not hasattr(self, 'timelineLogic'):
+            return
+        self.previewSegments = self.timelineLogic.model.getSourceSegments()
+        self.previewOffsets = []
+        total = 0
+        for segment in self.timelineLogic.model:
+            if segment.source == '':
+                self.previewOffsets.append(total)
+            total += segment.duration
+        self.overlayState = None
+        speed = self.timelineLogic.speed
+        self.mediaPlayer.setPlaybackRate(speed if self.preview and speed != 0 else 1)
+        self.updateOverlay()
+        if self.preview:
+            self.previewPosition(self.positionVideo)
+        else:
+            self.jumpTimer.stop()
+
+    def previewPosition(self, position):
+        model = self.previewSegments
+        index = self.timelineLogic.model.findSource(position, model)
+        if index >= 0 and position < model[index].start + model[index].duration:
+            following = index + 1
+            self.jumpTarget = model[following].start if following < len(model) else None
+            if self.isPlaying():
+                rate = self.mediaPlayer.playbackRate() or 1
+                self.jumpTimer.start(max(0, int((model[index].start + model[index].duration - position) / rate)))
+            return
+
+        self.jumpTimer.stop()
+        if index + 1 < len(model):
+            self.mediaPlayer.setPosition(model[index + 1].start)
+        elif self.isPlaying():
+            self.mediaPlayer.pause()
+
+    def jump(self):
+        if not self.preview:
+            return
+        if self.jumpTarget is None:
+            self.mediaPlayer.pause()
+        else:
+            self.mediaPlayer.setPosition(self.jumpTarget)
+
+    def getOutputTime(self, position):
+        index = self.timelineLogic.model.findSource(position, self.previewSegments)
+        if index < 0:
+            return 0
+        time = self.previewOffsets[index] + min(position - self.previewSegments[index].start, self.previewSegments[index].duration)
+        return time / (self.timelineLogic.speed or 1)
+
+    def updateOverlay(self):
+        overlays = []
+        if self.preview:
+            time = self.getOutputTime(self.positionVideo)
+            overlays = [overlay for overlay in self.timelineLogic.overlays if overlay.isActive(time)]
+        state = (tuple(overlays), self.videoWidget.size())
+        if state == self.overlayState:
+            return
+        self.overlayState = state
+
+        while len(self.overlayLabels) < len(overlays):
+            label = QLabel(self.videoWidget)
+            label.setAttribute(Qt.WA_TransparentForMouseEvents)
+            self.overlayLabels.append(label)
+        for label in self.overlayLabels[len(overlays):]:
+            label.hide()
+        for overlay, label in zip(overlays, self.overlayLabels):
+            self.showOverlay(overlay, label)
+
+    def showOverlay(self, overlay, label):
+        size = self.videoWidget.size()
+        resolution = self.mediaPlayer.metaData('Resolution')
+        if resolution is None or resolution.isEmpty():
+            resolution = size
+        scale = min(size.width() / resolution.width(), size.height() / resolution.height())
+        videoWidth, videoHeight = resolution.width() * scale, resolution.height() * scale
+
+        pixmap = QPixmap(overlay.image)
+        if overlay.height != 0:
+            pixmap = pixmap.scaledToHeight(overlay.height, Qt.SmoothTransformation)
+        pixmap = pixmap.scaled(max(1, int(pixmap.width() * scale)), max(1, int(pixmap.height() * scale)), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        factors = {'0': 0, 'w/2': 0.5, 'w': 1, 'h/2': 0.5, 'h': 1}
+        horizontal, vertical = positions[overlay.position]
+        x = (size.width() - videoWidth) / 2 + factors[horizontal] * (videoWidth - pixmap.width())
+        y = (size.height() - videoHeight) / 2 + factors[vertical] * (videoHeight - pixmap.height())
+
+        label.setPixmap(pixmap)
+        label.setGeometry(int(x), int(y), pixmap.width(), pixmap.height())
+        label.show()
+        label.raise_()
+
+    def eventFilter(self, watched, event):
+        if watched is self.videoWidget and event.type() == QEvent.Resize and hasattr(self, 'timelineLogic'):
+            self.updateOverlay()
+        return super().eventFilter(watched, event)
+
+    def openSource(self, file):
+        if self.analysisThread is not None:
+            self.analysisThread.analyzer.stop()
+        self.source = file
+        self.switchingMedia = False
+        if self.mediaPlayer is None:
+            self.createPlayer()
+        if self.frameCache is not None:
+            self.frameCache.stop()
+            self.frameCache = None
+        self.frameLabel.hide()
+        try:
+            info = probe(file)
+        except (RenderError, OSError, ValueError):
+            info = None
+        self.frameRate = info.getFps() if info is not None else 0
+        self.playhead.setFrameRate(self.frameRate)
+        if self.frameRate > 0 and info.width > 0 and info.height > 0:
+            self.frameCache = FrameCache(file, info, self.frameCacheBytes)
+        self.setMedia(file)
+        self.playButton.setEnabled(True)
+        self.mediaPlayer.play()
+
+    def startProxy(self, duration):
+        proxy = Proxy(self.source)
+        if proxy.isReady():
+            self.useProxy(proxy.file, proxy.path)
+            return
+        resolution = self.mediaPlayer.metaData('Resolution')
+        height = resolution.height() if resolution is not None else 0
+        if Proxy.isNeeded(self.source, duration, height):
+            thread = ProxyThread(proxy)
+            thread.ready.connect(self.useProxy)
+            thread.finished.connect(lambda: self.proxyThreads.remove(thread))
+            self.proxyThreads.append(thread)
+            thread.start()
+
+    def useProxy(self, source, path):
+        if source != self.source:
+            return
+        self.resume = (self.getPosition(), self.isPlaying())
+        self.switchingMedia = True
+        self.setMedia(path)
+
+    def addClip(self, file):
+        if not hasattr(self, 'timelineLogic'):
+            return
+        try:
+            info = probe(file)
+        except (RenderError, OSError, ValueError) as e:
+            QMessageBox.critical(self, 'Add clip', str(e))
+            return
+        self.timelineLogic.frameRates[file] = info.getFps()
+        self.timelineLogic.addClip(file, info.duration)
+
+    def autoCut(self):
+        if self.source == '' or self.analysisThread is not None:
+            return False
+        from analysis import SceneAnalyzer
+        self.analysisThread = AnalysisThread(SceneAnalyzer(self.source))
+        self.analysisThread.ready.connect(self.applyAutoCut)
+        self.analysisThread.failed.connect(lambda error: QMessageBox.critical(self, 'Auto cut', error))
+        self.analysisThread.finished.connect(self.analysisFinished)
+        self.analysisThread.start()
+        return True
+
+    def analysisFinished(self):
+        self.analysisThread = None
+
+    def applyAutoCut(self, source, cuts, silences):
+        if source != self.source:
+            return
+        self.timelineLogic.autoCut(cuts, silences)
+        self.analyzed.emit(f'Auto cut: {len(cuts)} scene changes, {len(silences)} silent ranges removed')
 
     def durationChanged(self, duration):
+        if self.switchingMedia:
+            if duration > 0:
+                self.switchingMedia = False
+                position, playing = self.resume
+                self.mediaPlayer.setPosition(position)
+                if playing:
+                    self.mediaPlayer.play()
+            return
+
         self.durationVideo = duration
         self.positionSlider.setRange(0, duration)
         self.timelineSlider.setRange(0, duration)
 
         self.timelineLogic = TimelineLogic(duration)
-        self.timelineWidget.setScene(self.timelineLogic.scene)
+        self.timelineLogic.frameRates[''] = self.frameRate
+        self.timelineWidget.setLogic(self.timelineLogic)
+        self.timelineLogic.setSource(self.source)
+        self.timelineLogic.undoStack.indexChanged.connect(self.updatePreview)
+        self.updatePreview()
         self.undoView.setStack(self.timelineLogic.undoStack)
+        if duration > 0:
+            self.startProxy(duration)
 
     def setPosition(self, position):
-        self.mediaPlayer.setPosition(position)
\ No newline at end of file
+        if self.playhead is not None:
+            self.playhead.seek(position)
+            self.showCachedFrame()
+
+    def stepFrame(self, frames):
+        if self.playhead is not None:
+            self.playhead.step(frames)
+            self.showCachedFrame()
+
+    def showCachedFrame(self):
+        if self.frameCache is None or self.isPlaying():
+            return
+        self.hideTimer.stop()
+        frame = self.frameCache.get(self.playhead.getFrame(self.playhead.position))
+        if frame is None:
+            self.frameLabel.hide()
+            return
+        height, width = frame.shape[:2]
+        image = QImage(frame.data, width, height, width * 3, QImage.Format_RGB888)
+        size = self.videoWidget.size()
+        pixmap = QPixmap.fromImage(image).scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.frameLabel.setPixmap(pixmap)
+        self.frameLabel.setGeometry((size.width() - pixmap.width()) // 2, (size.height() - pixmap.height()) // 2, pixmap.width(), pixmap.height())
+        self.frameLabel.show()
+        self.frameLabel.raise_()
+        for label in self.overlayLabels:
+            label.raise_()
+
+    def getPosition(self):
+        return self.positionVideo if self.playhead is None else self.playhead.position
\ No newline at end of file